@@ -46,6 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.throttling.LoadSheddingMiddleware',
+    'core.profiling.ServerTimingMiddleware',
+    'core.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -140,8 +144,84 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.AnonBucketThrottle',
+        'core.throttling.UserBucketThrottle',
+        'core.throttling.ConcurrencyThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '120/min',
+        'user': '600/min',
+        'login': '10/min',
+    },
 }
 
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
+
+# Directory shared by the worker processes to aggregate metrics, leave unset
+# to keep the metrics in process
+METRICS_DIR = os.environ.get('METRICS_DIR')
+
+# Addresses allowed to scrape /metrics, comma separated, staff users may
+# read it from anywhere
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS',
+                                     '127.0.0.1,::1').split(',')
+
+# Staff users sending X-Debug-Timing to these paths get a Server-Timing
+# header, sending "X-Debug-Timing: profile" also writes a cProfile dump
+SERVER_TIMING_PATHS = ['/api/recipe/', '/api/user/']
+SERVER_TIMING_PROFILE_DIR = os.environ.get('SERVER_TIMING_PROFILE_DIR')
+
+# Precomputed OpenAPI schema files, written by manage.py build_schema
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR',
+                                  BASE_DIR / 'schema_cache')
+
+# Seconds before the in process recipe similarity index of a user is rebuilt,
+# bounds how long changes made by other workers take to show up
+RECIPE_INDEX_TTL = 60
+
+# Number of users whose recipe index is kept in memory, the least recently
+# used is dropped first
+RECIPE_INDEX_MAX_USERS = 1000
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = 1024
+
+# collectstatic writes hashed file names with .gz and .br siblings, served
+# by core.views.serve_static with far future cache headers
+if not DEBUG:
+    STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
+# Token buckets of the throttles, kept per worker: the buckets are read and
+# written back without an atomic operation of the cache, so a cache shared
+# by the workers would let concurrent requests overwrite each other's take
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
+}
+
+# Expensive views a client may run only this many times at once per worker
+CONCURRENCY_LIMITED_VIEWS = [
+    'CreateTokenView.post',
+    'CreateUserView.post',
+    'RecipeViewSet.list',
+    'RecipeViewSet.shopping_list',
+]
+CONCURRENCY_LIMIT_PER_CLIENT = 2
+
+# Answer 503 once requests waited longer than LOAD_SHED_QUEUE_TIME seconds
+# in the proxy, as told by X-Request-Start, for LOAD_SHED_INTERVAL seconds
+LOAD_SHED_QUEUE_TIME = 1.0
+LOAD_SHED_INTERVAL = 5.0
+
+# Seconds an API token stays valid after login, and between two writes of
+# the buffered last use times of the tokens
+TOKEN_TTL = 30 * 24 * 3600
+TOKEN_USAGE_FLUSH_INTERVAL = 60
@@ -14,17 +14,20 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
+from django.urls import path, include, re_path
+from drf_spectacular.views import SpectacularSwaggerView
 from django.conf.urls.static import static
 from django.conf import settings
+from core.schema import CachedSpectacularAPIView
+from core.views import metrics_view, serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
+    path(
+        'api/schema/',
+        CachedSpectacularAPIView.as_view(),
+        name='api-schema',
+    ),
     path(
         'api/docs/',
         SpectacularSwaggerView.as_view(url_name='api-schema'),
@@ -32,6 +35,8 @@ urlpatterns = [
     ),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
+    path('api/core/', include('core.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -39,3 +44,11 @@ if settings.DEBUG:
         settings.MEDIA_URL,
         document_root=settings.MEDIA_ROOT
     )
+else:
+    urlpatterns += [
+        re_path(
+            r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'),
+            serve_static,
+            name='static',
+        ),
+    ]
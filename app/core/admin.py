@@ -3,12 +3,26 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from core import models
 from django.utils.translation import gettext_lazy as _
+from core.pagination import EstimatedCountPaginator
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables with millions of rows"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ['user']
+    list_per_page = 50
+    # pages are cut from a stable order, newest rows first
+    ordering = ['-id']
 
 
 class UserAdmin(BaseUserAdmin):
     """Define admin pages for users"""
     ordering = ['id']
     list_display = ['email', 'name']
+    search_fields = ['email']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         (
             _('Main info'),
@@ -56,7 +70,24 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class RecipeAdmin(ScalableAdmin):
+    """Define admin pages for recipes"""
+    list_display = ['title', 'user', 'time_minutes', 'price', 'updated_at']
+    search_fields = ['title']
+    list_filter = ['updated_at']
+    autocomplete_fields = ['user', 'tags', 'ingredients']
+    readonly_fields = ['updated_at']
+
+
+class RecipeAttrAdmin(ScalableAdmin):
+    """Define admin pages for tags and ingredients"""
+    list_display = ['name', 'user', 'updated_at']
+    search_fields = ['name']
+    autocomplete_fields = ['user']
+    readonly_fields = ['updated_at']
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.Tag, RecipeAttrAdmin)
+admin.site.register(models.Ingredient, RecipeAttrAdmin)
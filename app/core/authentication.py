@@ -0,0 +1,16 @@
+"""Authentication for the API"""
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core import tokens
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """Token authentication refusing expired tokens and tracking usage"""
+
+    def authenticate_credentials(self, key):
+        user, token = super().authenticate_credentials(key)
+        if tokens.is_expired(token):
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        tokens.touch(token.key)
+        return user, token
@@ -0,0 +1,145 @@
+"""
+Coalescing of identical concurrent requests
+
+While one thread computes the response of a read, the threads receiving
+the same request for the same user wait for it and reuse its rendered bytes
+instead of running the same queries again. Waits are bounded: a waiter
+whose leader takes too long, fails or produces a streaming response
+computes its own response.
+
+The key holds a write generation of the user, bumped when one of their
+writes returns, so a read sent after a write never gets a response computed
+before it. This holds within a worker process: writes served by another
+worker are not seen.
+"""
+import threading
+
+from django.http import HttpResponse
+from rest_framework.permissions import SAFE_METHODS
+
+from core import metrics
+
+
+class Flight:
+    """One computation in progress"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = True
+
+
+class SingleFlight:
+    """Run a function once per key for the callers arriving together"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, timeout):
+        """Return (result, shared), shared tells if another call made it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+        if not leader:
+            if flight.done.wait(timeout) and not flight.failed:
+                return flight.result, True
+            return fn(), False
+        try:
+            flight.result = fn()
+            flight.failed = False
+            return flight.result, False
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self):
+        """Number of keys being computed"""
+        with self._lock:
+            return len(self._flights)
+
+
+flights = SingleFlight()
+
+# write generations of the users, hashed into a fixed number of slots:
+# users sharing a slot only get fewer reads coalesced
+_generations = [0] * 1024
+_generations_lock = threading.Lock()
+
+
+def write_generation(user_id):
+    """Return the number of writes seen for the slot of the user"""
+    return _generations[hash(user_id) % len(_generations)]
+
+
+def wrote(user_id):
+    """Record that a write of the user returned"""
+    with _generations_lock:
+        _generations[hash(user_id) % len(_generations)] += 1
+
+
+def snapshot(response):
+    """Copy what is needed to send a rendered response again"""
+    if response.streaming:
+        return None
+    return response.status_code, response.content, list(response.items())
+
+
+def from_snapshot(copied):
+    """Build a new response from a snapshot"""
+    status_code, content, headers = copied
+    response = HttpResponse(content, status=status_code)
+    for header, value in headers:
+        response[header] = value
+    return response
+
+
+class CoalesceReadsMixin:
+    """Share the response of identical concurrent reads of a DRF view
+
+    Requests are identical when the user, the action, the full path and
+    the Accept header match, and no write of the user returned in between.
+    """
+    coalesce_actions = ('list', 'retrieve')
+    coalesce_timeout = 5
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method == 'GET' and self.action in self.coalesce_actions:
+            self.get = self._coalesced(self.get)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and \
+                request.user and request.user.is_authenticated:
+            wrote(request.user.pk)
+        return response
+
+    def _coalesced(self, handler):
+        def get(request, *args, **kwargs):
+            key = (type(self).__name__, self.action, request.user.pk,
+                   write_generation(request.user.pk),
+                   request.get_full_path(), request.META.get('HTTP_ACCEPT'))
+
+            def compute():
+                response = self.finalize_response(
+                    request, handler(request, *args, **kwargs),
+                    *args, **kwargs)
+                if hasattr(response, 'render'):
+                    response.render()
+                return response, snapshot(response)
+
+            (response, copied), shared = flights.do(
+                key, compute, self.coalesce_timeout)
+            if not shared:
+                return response
+            if copied is None:
+                return handler(request, *args, **kwargs)
+            metrics.inc('http_coalesced_requests_total',
+                        view=f'{type(self).__name__}.{self.action}')
+            return from_snapshot(copied)
+        return get
@@ -0,0 +1,145 @@
+"""
+Response compression
+
+CompressionMiddleware compresses text and JSON responses with brotli, when
+the optional brotli package is installed, or gzip, whichever the client
+prefers. Responses smaller than COMPRESSION_MIN_SIZE are sent as they are,
+streaming responses are compressed chunk by chunk. Static files are
+compressed once by collectstatic instead, see core.storage, and responses
+with a true compression_exempt attribute are left alone.
+"""
+import gzip
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# levels fast enough to compress responses at request time
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/|application/([\w.+-]*\+)?(json|javascript|xml|x-ndjson)|'
+    r'application/vnd\.oai\.openapi|image/svg\+xml)'
+)
+
+
+def available_encodings():
+    """Return the supported encodings, the preferred first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def is_compressible(content_type):
+    """Tell whether content of this type is worth compressing"""
+    return bool(content_type) and \
+        COMPRESSIBLE_TYPES.match(content_type.lower()) is not None
+
+
+def accepted_encodings(header):
+    """Parse an Accept-Encoding header into {coding: quality}"""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        match = re.search(r'q\s*=\s*([\d.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(header, encodings=None):
+    """Return the best of encodings the client accepts, or None"""
+    accepted = accepted_encodings(header or '')
+    best, best_quality = None, 0.0
+    for coding in encodings or available_encodings():
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(data, encoding, best=False):
+    """Compress bytes for the encoding, best trades speed for size"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL,
+                         mtime=0)
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _gzip_sequence(sequence):
+    # wbits=31 writes the gzip header and trailer around the deflate data
+    compressor = zlib.compressobj(GZIP_LEVEL, wbits=31)
+    for item in sequence:
+        data = compressor.compress(item) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_stream(sequence, encoding):
+    """Compress an iterable of bytes, flushing after every item"""
+    if encoding == 'br':
+        return _brotli_sequence(sequence)
+    return _gzip_sequence(sequence)
+
+
+class CompressionMiddleware:
+    """Compress text and JSON responses the client accepts compressed"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(response, 'compression_exempt', False) or \
+                response.has_header('Content-Encoding') or \
+                not is_compressible(response.get('Content-Type')):
+            return response
+        if not response.streaming and \
+                len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(
+                response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # the compressed body is not byte for byte the tagged one anymore
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
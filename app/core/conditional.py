@@ -0,0 +1,44 @@
+"""
+Conditional requests on versioned rows
+
+The ETag of an object is its version column. A client sending back an
+ETag in If-Match only gets its write applied while the row is still at
+that version, otherwise it receives 412 and fetches the object again.
+"""
+import re
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+ETAG = re.compile(r'^(W/)?"(\d+)"$')
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The object was changed since the version in If-Match.'
+    default_code = 'precondition_failed'
+
+
+def etag(version):
+    """Return the ETag header value of a version"""
+    return f'"{version}"'
+
+
+def if_match_versions(request):
+    """Return the versions If-Match accepts, None when any will do
+
+    A weak ETag matches too: the compression middleware weakens the ETags
+    of the bodies it compresses, the version stays the same. Raises
+    PreconditionFailed when no tag of the header can be one of ours.
+    """
+    header = request.META.get('HTTP_IF_MATCH')
+    if header is None or header.strip() == '*':
+        return None
+    versions = []
+    for tag in header.split(','):
+        match = ETAG.match(tag.strip())
+        if match:
+            versions.append(int(match.group(2)))
+    if not versions:
+        raise PreconditionFailed()
+    return versions
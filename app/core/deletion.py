@@ -0,0 +1,108 @@
+"""
+Background deletion of users and their data
+
+Deleting a user through the ORM makes the collector load every recipe, tag
+and ingredient of the user and delete them in one long transaction. Instead
+the account is deactivated at once and a background job removes the rows
+with raw SQL, one bounded chunk per transaction with a pause in between,
+before the emptied user row is deleted through the ORM.
+"""
+import logging
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core import jobs
+from core.models import Recipe, Tag, Ingredient, Tombstone
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+PAUSE = 0.05
+
+
+def request_deletion(user):
+    """Deactivate the user now and queue the purge of their data"""
+    user.is_active = False
+    user.deletion_requested_at = timezone.now()
+    user.save(update_fields=['is_active', 'deletion_requested_at'])
+    Token.objects.filter(user=user).delete()
+    return jobs.enqueue('core.deletion.purge_user', {'user_id': user.pk},
+                        user=user)
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _delete_chunk(model, user_id, chunk_size, links=()):
+    """Delete up to chunk_size rows of the user and their M2M links
+
+    links lists the (through model, column) pairs pointing at the model.
+    Returns the rows deleted, as (id, *returning) tuples.
+    """
+    quote = connection.ops.quote_name
+    returning = ', image' if model is Recipe else ''
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT id FROM {_table(model)} WHERE user_id = %s '
+            f'ORDER BY id LIMIT %s',
+            [user_id, chunk_size],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return []
+        for through, column in links:
+            cursor.execute(
+                f'DELETE FROM {_table(through)} '
+                f'WHERE {quote(column)} = ANY(%s)',
+                [ids],
+            )
+        cursor.execute(
+            f'DELETE FROM {_table(model)} WHERE id = ANY(%s) '
+            f'RETURNING id{returning}',
+            [ids],
+        )
+        return cursor.fetchall()
+
+
+def purge_user(user_id, chunk_size=CHUNK_SIZE, pause=PAUSE):
+    """Delete everything the user owns, chunk by chunk, then the user
+
+    Recipe images are removed from storage once their rows are committed.
+    Returns the number of rows deleted per model.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    plan = [
+        (Recipe, [(Recipe.tags.through, 'recipe_id'),
+                  (Recipe.ingredients.through, 'recipe_id')]),
+        (Tag, [(Recipe.tags.through, 'tag_id')]),
+        (Ingredient, [(Recipe.ingredients.through, 'ingredient_id')]),
+        (Tombstone, []),
+    ]
+    deleted = {}
+    for model, links in plan:
+        deleted[model._meta.model_name] = 0
+        while True:
+            rows = _delete_chunk(model, user_id, chunk_size, links)
+            deleted[model._meta.model_name] += len(rows)
+            for _, *image in rows:
+                if image and image[0]:
+                    storage.delete(image[0])
+            if len(rows) < chunk_size:
+                break
+            time.sleep(pause)
+    get_user_model().objects.filter(pk=user_id).delete()
+    logger.info('Purged user %s: %s', user_id, deleted)
+    return deleted
+
+
+def pending_users():
+    """Return the IDs of the users waiting to be purged"""
+    return get_user_model().objects \
+        .filter(deletion_requested_at__isnull=False) \
+        .order_by('deletion_requested_at') \
+        .values_list('id', flat=True)
@@ -0,0 +1,130 @@
+"""
+Background jobs stored in Postgres
+
+A job names an importable function and the keyword arguments to call it
+with. Workers claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of them can poll the table without handing a job out twice, and a
+failed job is queued again with an exponential backoff until it runs out of
+attempts. Enqueueing inside a transaction only publishes the job on commit.
+While a job runs its worker refreshes locked_at every HEARTBEAT_INTERVAL,
+a job left without one for STALE_AFTER belongs to a lost worker.
+"""
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core import metrics
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 3600
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = 300
+
+
+def enqueue(name, payload=None, user=None, delay=0, max_attempts=3):
+    """Queue a call of the function at dotted path name"""
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        user=user,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+
+
+def worker_id():
+    """Identify this worker process in the locked_by column"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker, limit=1):
+    """Lock up to limit due jobs for the worker and return their IDs"""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by('run_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if ids:
+            Job.objects.filter(id__in=ids).update(
+                status=Job.RUNNING, locked_at=now, locked_by=worker,
+                attempts=F('attempts') + 1)
+    return ids
+
+
+def heartbeat(worker, job_ids):
+    """Tell the jobs the worker is still running are alive"""
+    return Job.objects.filter(
+        id__in=job_ids, status=Job.RUNNING, locked_by=worker,
+    ).update(locked_at=timezone.now())
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt"""
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def execute(job_id):
+    """Run a claimed job and record its outcome, returns the final status"""
+    job = Job.objects.get(id=job_id)
+    started = time.monotonic()
+    try:
+        result = import_string(job.name)(**job.payload)
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed', job.id, job.name)
+        job.last_error = repr(exc)
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(
+                seconds=retry_delay(job.attempts))
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.SUCCEEDED
+        job.result = result
+        job.last_error = ''
+        job.finished_at = timezone.now()
+    job.locked_at = None
+    job.save(update_fields=['status', 'result', 'last_error', 'run_at',
+                            'locked_at', 'finished_at'])
+    metrics.inc('jobs_total', job=job.name, status=job.status)
+    metrics.observe('job_duration_seconds', time.monotonic() - started,
+                    job=job.name)
+    return job.status
+
+
+def run_in_worker(job_id):
+    """Execute a job from a pool thread or process"""
+    try:
+        return execute(job_id)
+    finally:
+        connection.close()
+
+
+def requeue_stale(stale_after=STALE_AFTER):
+    """Release the jobs of workers that died while running them
+
+    Jobs with attempts left are queued again, the others are failed.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING,
+                               locked_at__lt=now - timedelta(
+                                   seconds=stale_after))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, locked_at=None, finished_at=now,
+        last_error='Worker lost')
+    queued = stale.update(status=Job.QUEUED, locked_at=None, run_at=now)
+    return queued + failed
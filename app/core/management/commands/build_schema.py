@@ -0,0 +1,16 @@
+"""
+Django command to precompute the OpenAPI schema
+"""
+from django.core.management.base import BaseCommand
+from core import schema
+
+
+class Command(BaseCommand):
+    """Write the schema files served by /api/schema/"""
+    help = 'Generate the OpenAPI schema for the current code'
+
+    def handle(self, *args, **options):
+        """Enterpoint for command"""
+        for fmt in schema.RENDERERS:
+            path = schema.write_schema(fmt)
+            self.stdout.write(self.style.SUCCESS(f'Schema written to {path}'))
@@ -0,0 +1,72 @@
+"""
+Django command to create many users from a CSV file
+"""
+import csv
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from core import provisioning
+
+
+class Command(BaseCommand):
+    """Django command to import users"""
+    help = ('Create users from a CSV file with email, password and name '
+            'columns, hashing the passwords on all cores')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file, - for stdin')
+        parser.add_argument('--batch-size', type=int,
+                            default=provisioning.BATCH_SIZE,
+                            help='Users inserted per query')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes hashing passwords')
+        parser.add_argument('--tokens', metavar='PATH',
+                            help='Create API tokens and write them as CSV')
+
+    def _executor(self, workers):
+        if workers <= 1:
+            return nullcontext()
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+
+    def _progress(self, result):
+        self.stdout.write(f'{result.created} users created, '
+                          f'{result.rate:.0f}/s')
+
+    def handle(self, *args, **options):
+        """Enterpoint for command"""
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        workers = max(1, options['workers'] or 1)
+        path = options['path']
+        try:
+            lines = open(path, newline='') if path != '-' else \
+                nullcontext(sys.stdin)
+        except OSError as exc:
+            raise CommandError(exc)
+        with lines as f, self._executor(workers) as executor:
+            result = provisioning.import_users(
+                provisioning.read_rows(f),
+                batch_size=options['batch_size'],
+                create_tokens=bool(options['tokens']),
+                executor=executor,
+                workers=workers,
+                progress=self._progress,
+            )
+        if options['tokens']:
+            with open(options['tokens'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['email', 'token'])
+                writer.writerows(result.tokens)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created} users, skipped {result.skipped}, '
+            f'{result.rate:.0f} users/s with {workers} workers'))
@@ -0,0 +1,26 @@
+"""
+Django command to purge the users who asked for their account deletion
+"""
+from django.core.management.base import BaseCommand
+
+from core import deletion
+
+
+class Command(BaseCommand):
+    """Django command to purge deleted users"""
+    help = 'Delete the data of deactivated users pending deletion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int,
+                            default=deletion.CHUNK_SIZE,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=deletion.PAUSE,
+                            help='Seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        """Enterpoint for command"""
+        for user_id in list(deletion.pending_users()):
+            deleted = deletion.purge_user(user_id, options['chunk_size'],
+                                          options['pause'])
+            self.stdout.write(f'Purged user {user_id}: {deleted}')
+        self.stdout.write(self.style.SUCCESS('Done'))
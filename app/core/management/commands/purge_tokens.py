@@ -0,0 +1,25 @@
+"""
+Django command to delete the expired API tokens
+"""
+from django.core.management.base import BaseCommand
+
+from core import tokens
+
+
+class Command(BaseCommand):
+    """Django command to purge expired tokens"""
+    help = 'Delete the API tokens older than TOKEN_TTL in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int,
+                            default=tokens.CHUNK_SIZE,
+                            help='Tokens deleted per transaction')
+        parser.add_argument('--pause', type=float, default=tokens.PAUSE,
+                            help='Seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        """Enterpoint for command"""
+        deleted = tokens.purge_expired(options['chunk_size'],
+                                       options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired tokens'))
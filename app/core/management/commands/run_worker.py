@@ -0,0 +1,103 @@
+"""
+Django command to run the background jobs
+"""
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import django
+from django.core.management.base import BaseCommand
+
+from core import jobs
+
+logger = logging.getLogger(__name__)
+
+STALE_CHECK_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    """Django command to run background jobs"""
+    help = 'Claim queued jobs and run them in a thread or process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Jobs run at the same time')
+        parser.add_argument('--pool', choices=['thread', 'process'],
+                            default='thread',
+                            help='Use processes for CPU bound jobs')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def _executor(self, pool, concurrency):
+        if pool == 'thread':
+            return ThreadPoolExecutor(max_workers=concurrency)
+        # spawned processes set Django up again instead of sharing the
+        # database connection of this process
+        return ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+
+    def _stop(self, signum, frame):
+        self.stdout.write('Stopping after the running jobs...')
+        self.stopping = True
+
+    def handle(self, *args, **options):
+        """Enterpoint for command"""
+        concurrency = options['concurrency']
+        worker = jobs.worker_id()
+        self.stopping = False
+        handlers = {signum: signal.signal(signum, self._stop)
+                    for signum in (signal.SIGTERM, signal.SIGINT)}
+        self.stdout.write(f'Worker {worker} started')
+        try:
+            self._work(worker, concurrency, options)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker} stopped'))
+
+    def _work(self, worker, concurrency, options):
+        running = set()
+        job_ids = {}
+        next_stale_check = 0
+        next_heartbeat = time.monotonic() + jobs.HEARTBEAT_INTERVAL
+        with self._executor(options['pool'], concurrency) as executor:
+            while not self.stopping:
+                if time.monotonic() >= next_stale_check:
+                    jobs.requeue_stale()
+                    next_stale_check = time.monotonic() + \
+                        STALE_CHECK_INTERVAL
+                if time.monotonic() >= next_heartbeat:
+                    jobs.heartbeat(worker, list(job_ids.values()))
+                    next_heartbeat = time.monotonic() + \
+                        jobs.HEARTBEAT_INTERVAL
+                claimed = jobs.claim(worker, concurrency - len(running)) \
+                    if len(running) < concurrency else []
+                for job_id in claimed:
+                    future = executor.submit(jobs.run_in_worker, job_id)
+                    running.add(future)
+                    job_ids[future] = job_id
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, running = wait(
+                    running, return_when=FIRST_COMPLETED,
+                    timeout=0 if claimed else options['poll_interval'])
+                for future in done:
+                    del job_ids[future]
+                    if future.exception() is not None:
+                        logger.error('Job crashed the pool',
+                                     exc_info=future.exception())
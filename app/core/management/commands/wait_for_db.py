@@ -1,25 +1,70 @@
 """
 Django command to wait for db to be available
 """
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
 import time
 from psycopg2 import OperationalError as Psycopg2OpError
 from django.db.utils import OperationalError  # when the database is not ready
 
+INITIAL_DELAY = 0.05
+MAX_DELAY = 2
+
 
 class Command(BaseCommand):
     """Django command to wait for database"""
+    help = 'Wait until the database accepts connections'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout', type=float, default=None,
+            help='Seconds to wait before giving up, 0 checks only once',
+        )
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--require-migrated', action='store_true',
+            help='Also wait until no migration is pending, so the caller '
+                 'can skip migrate when this succeeds',
+        )
+
+    def ping(self, database):
+        """Run the cheapest query possible"""
+        with connections[database].cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def pending_migrations(self, database):
+        """Return the migrations not applied yet"""
+        executor = MigrationExecutor(connections[database])
+        return executor.migration_plan(executor.loader.graph.leaf_nodes())
 
     def handle(self, *args, **options):
         """Enterpoint for command"""
+        database = options['database']
+        timeout = options['timeout']
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = INITIAL_DELAY
         self.stdout.write("... Waiting for database ...")
-        db_up = False
-        while db_up is False:
+        while True:
             try:
-                self.check(databases=['default'])
-                db_up = True
+                self.ping(database)
+                if not options['require_migrated']:
+                    break
+                pending = len(self.pending_migrations(database))
+                if not pending:
+                    break
+                message = f'PENDING MIGRATIONS: {pending} not applied yet'
             except(Psycopg2OpError, OperationalError):
-                self.stdout.write('UNAVAILABLE DATABASE: \
-                                  Database is not available at the moment...')
-                time.sleep(1)
+                connections[database].close()
+                message = 'UNAVAILABLE DATABASE: ' \
+                    'Database is not available at the moment...'
+            self.stdout.write(message)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(f'Gave up after {timeout}s: {message}')
+                delay = min(delay, remaining)
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_DELAY)
         self.stdout.write(self.style.SUCCESS('DATABASE AVAILABLE!'))
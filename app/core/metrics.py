@@ -0,0 +1,307 @@
+"""
+Prometheus style metrics aggregated in process
+
+Values live in a dict guarded by a short lock. When METRICS_DIR is set every
+process writes its values into its own mmap'd file in that directory and the
+exposition merges all the files, so every worker is reported. The files of
+processes that exited are folded into metrics-dead.db, keeping the counters
+of recycled workers without one file per pid ever started.
+"""
+import fcntl
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+                16777216)
+
+_METRICS = {}
+
+
+def counter(name, documentation):
+    """Declare a counter"""
+    _METRICS[name] = ('counter', documentation, None)
+
+
+def histogram(name, documentation, buckets):
+    """Declare a histogram with upper bucket bounds"""
+    _METRICS[name] = ('histogram', documentation, tuple(buckets))
+
+
+counter('http_requests_total', 'Requests by view, method and status')
+histogram('http_request_duration_seconds', 'Request latency by view',
+          LATENCY_BUCKETS)
+histogram('http_response_size_bytes', 'Response body size by view',
+          SIZE_BUCKETS)
+counter('db_queries_total', 'SQL queries run by view')
+counter('db_query_duration_seconds_total', 'Time spent in SQL by view')
+counter('http_coalesced_requests_total',
+        'Requests answered with the response of an identical one by view')
+counter('http_rejected_requests_total',
+        'Requests refused by view and reason: throttle scope, concurrency '
+        'or overload')
+counter('cache_requests_total', 'Cache lookups by cache and result')
+histogram('recipe_image_upload_bytes', 'Size of uploaded recipe images',
+          SIZE_BUCKETS)
+counter('jobs_total', 'Background jobs run by name and outcome')
+histogram('job_duration_seconds', 'Background job run time by name',
+          (0.1, 0.5, 1.0, 5.0, 30.0, 120.0, 600.0))
+
+
+class MmapValues:
+    """Float values keyed by string stored in an mmap'd file
+
+    Layout: an 8 byte header holding the used size, then entries made of a
+    4 byte key length, the utf-8 key padded to 8 bytes and an 8 byte double.
+    """
+    _INITIAL_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._file.truncate(self._INITIAL_SIZE)
+            size = self._INITIAL_SIZE
+        self._capacity = size
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._positions = {}
+        self._used = struct.unpack_from('q', self._map, 0)[0] or 8
+        for key, _, pos in _read_entries(self._map, self._used):
+            self._positions[key] = pos
+
+    def _add_key(self, key):
+        encoded = key.encode('utf-8')
+        padded = len(encoded) + (-(len(encoded) + 4) % 8)
+        entry = struct.pack(f'i{padded}sd', len(encoded), encoded, 0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._map.close()
+            self._file.truncate(self._capacity)
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._map[self._used:self._used + len(entry)] = entry
+        pos = self._used + len(entry) - 8
+        self._used += len(entry)
+        struct.pack_into('q', self._map, 0, self._used)
+        self._positions[key] = pos
+        return pos
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def add(self, key, amount):
+        """Add amount to the value stored under key"""
+        pos = self._positions.get(key)
+        if pos is None:
+            pos = self._add_key(key)
+        value = struct.unpack_from('d', self._map, pos)[0]
+        struct.pack_into('d', self._map, pos, value + amount)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_entries(data, used):
+    """Yield (key, value, value position) for the entries in data"""
+    pos = 8
+    while pos < used:
+        length = struct.unpack_from('i', data, pos)[0]
+        padded = length + (-(length + 4) % 8)
+        key = bytes(data[pos + 4:pos + 4 + length]).decode('utf-8')
+        pos += 4 + padded
+        value = struct.unpack_from('d', data, pos)[0]
+        yield key, value, pos
+        pos += 8
+
+
+def _read_file(path):
+    """Return the (key, value) pairs of another process' file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return []
+    used = min(struct.unpack_from('q', data, 0)[0], len(data))
+    return [(key, value) for key, value, _ in _read_entries(data, used)]
+
+
+class Registry:
+    """Holds the metric values of this process"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._values = {}
+        self._store = None
+        self._pid = None
+
+    def _get_store(self):
+        """Open the mmap file of this process, reopening after a fork"""
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            path = os.path.join(self.directory, f'metrics-{pid}.db')
+            self._store = MmapValues(path)
+        return self._store
+
+    def add(self, name, labels, amount):
+        """Add amount to the sample name{labels}"""
+        key = json.dumps([name, sorted(labels.items())])
+        with self._lock:
+            if self.directory:
+                self._get_store().add(key, amount)
+            else:
+                self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        """Return the samples merged across all processes"""
+        with self._lock:
+            if not self.directory:
+                return dict(self._values)
+        merged = {}
+        pattern = os.path.join(self.directory, 'metrics-*.db')
+        lock_path = os.path.join(self.directory, 'metrics.lock')
+        with open(lock_path, 'a') as lock:
+            # one reader at a time, a file must not be read while folded
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._fold_dead(glob.glob(pattern))
+            for path in glob.glob(pattern):
+                for key, value in _read_file(path):
+                    merged[key] = merged.get(key, 0.0) + value
+        return merged
+
+    def _fold_dead(self, paths):
+        """Move the values of exited processes into metrics-dead.db"""
+        dead = None
+        for path in paths:
+            pid = os.path.basename(path)[len('metrics-'):-len('.db')]
+            if not pid.isdigit() or _pid_alive(int(pid)):
+                continue
+            if dead is None:
+                dead = MmapValues(
+                    os.path.join(self.directory, 'metrics-dead.db'))
+            for key, value in _read_file(path):
+                dead.add(key, value)
+            os.remove(path)
+        if dead is not None:
+            dead.close()
+
+
+_registry = None
+
+
+def get_registry():
+    """Return the registry configured by settings"""
+    global _registry
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if _registry is None or _registry.directory != directory:
+        _registry = Registry(directory)
+    return _registry
+
+
+def inc(name, amount=1, **labels):
+    """Increment a counter"""
+    get_registry().add(name, labels, amount)
+
+
+def observe(name, value, **labels):
+    """Record an observation in a histogram"""
+    registry = get_registry()
+    for bound in _METRICS[name][2]:
+        if value <= bound:
+            break
+    else:
+        bound = '+Inf'
+    registry.add(f'{name}_bucket', dict(labels, le=str(bound)), 1)
+    registry.add(f'{name}_sum', labels, value)
+    registry.add(f'{name}_count', labels, 1)
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup as a hit or a miss"""
+    inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and their total time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - start)
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace('\\', r'\\').replace('"', r'\"')
+        value = value.replace('\n', r'\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render():
+    """Render every sample in the Prometheus text format"""
+    samples = {}
+    for key, value in get_registry().samples().items():
+        name, labels = json.loads(key)
+        samples.setdefault(name, []).append((tuple(map(tuple, labels)),
+                                             value))
+    lines = []
+    for name, (kind, documentation, buckets) in sorted(_METRICS.items()):
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for labels, value in sorted(samples.get(name, [])):
+                lines.append(
+                    f'{name}{_format_labels(labels)} {_format_value(value)}')
+            continue
+        series = {}
+        for labels, value in samples.get(f'{name}_bucket', []):
+            le = dict(labels)['le']
+            rest = tuple(label for label in labels if label[0] != 'le')
+            series.setdefault(rest, {})[le] = value
+        for labels, counts in sorted(series.items()):
+            total = 0
+            for bound in [str(b) for b in buckets] + ['+Inf']:
+                total += counts.get(bound, 0)
+                bucket_labels = sorted(labels + (('le', bound),))
+                lines.append(f'{name}_bucket{_format_labels(bucket_labels)}'
+                             f' {_format_value(total)}')
+            for suffix in ('sum', 'count'):
+                value = dict(samples.get(f'{name}_{suffix}', [])).get(
+                    labels, 0)
+                lines.append(f'{name}_{suffix}{_format_labels(labels)}'
+                             f' {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
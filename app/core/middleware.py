@@ -0,0 +1,45 @@
+"""Middleware for the whole project"""
+import time
+
+from django.db import connection
+
+from core import metrics
+
+
+def view_label(request, view_func):
+    """Return a label like RecipeViewSet.list for the resolved view"""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class MetricsMiddleware:
+    """Record latency, SQL and response size of every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = metrics.QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view = getattr(request, 'metrics_view', 'unmatched')
+        metrics.inc('http_requests_total', view=view, method=request.method,
+                    status=str(response.status_code))
+        metrics.observe('http_request_duration_seconds', duration, view=view)
+        metrics.inc('db_queries_total', queries.count, view=view)
+        metrics.inc('db_query_duration_seconds_total', queries.duration,
+                    view=view)
+        if not response.streaming:
+            metrics.observe('http_response_size_bytes',
+                            len(response.content), view=view)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_label(request, view_func)
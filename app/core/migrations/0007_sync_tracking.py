@@ -0,0 +1,94 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+TABLES = ['core_recipe', 'core_tag', 'core_ingredient', 'core_tombstone']
+
+# every write stamps the row with the ID of its transaction, which orders
+# the sync feed the way the database commits rather than by a clock
+CREATE_TRIGGERS = [
+    'CREATE FUNCTION "core_set_txid"() RETURNS trigger AS $$ '
+    'BEGIN NEW."txid" := txid_current(); RETURN NEW; END; '
+    '$$ LANGUAGE plpgsql',
+] + [
+    f'CREATE TRIGGER "{table}_txid" BEFORE INSERT OR UPDATE ON "{table}" '
+    f'FOR EACH ROW EXECUTE PROCEDURE "core_set_txid"()'
+    for table in TABLES
+]
+DROP_TRIGGERS = [
+    f'DROP TRIGGER IF EXISTS "{table}_txid" ON "{table}"' for table in TABLES
+] + ['DROP FUNCTION IF EXISTS "core_set_txid"()']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_user_name_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+                ('txid', models.BigIntegerField(default=0, editable=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='txid',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='txid',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='txid',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'txid', 'id'], name='core_ingred_user_id_f4c3a1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'txid', 'id'], name='core_recipe_user_id_82dfec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'txid', 'id'], name='core_tag_user_id_c69d5e_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'txid', 'id'], name='core_tombst_user_id_d03c67_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:17
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+# icontains compiles to UPPER(column::text) LIKE UPPER(%s), so the trigram
+# indexes are built on that expression
+TRIGRAM_INDEXES = [
+    ('core_recipe_title_trgm', 'core_recipe', 'title'),
+    ('core_tag_name_trgm', 'core_tag', 'name'),
+    ('core_ingredient_name_trgm', 'core_ingredient', 'name'),
+    ('core_user_email_trgm', 'core_user', 'email'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Index the admin searches when the server ships pg_trgm
+
+    Without the extension the searches keep working, just unindexed.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions "
+                       "WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in TRIGRAM_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+                f'ON "{table}" USING gin (UPPER("{column}"::text) '
+                f'gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for name, _, _ in TRIGRAM_INDEXES:
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_sync_tracking'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at'], name='core_recipe_updated_26452f_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
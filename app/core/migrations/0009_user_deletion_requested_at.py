@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='deletion_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('deletion_requested_at__isnull', False)), fields=['deletion_requested_at'], name='core_user_pending_deletion'),
+        ),
+    ]
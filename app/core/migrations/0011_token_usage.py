@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# the purge of expired tokens selects them by creation time
+CREATE_INDEX = ('CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                '"core_authtoken_created" ON "authtoken_token" ("created")')
+DROP_INDEX = 'DROP INDEX CONCURRENTLY IF EXISTS "core_authtoken_created"'
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('authtoken', '0003_tokenproxy'),
+        ('core', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenUsage',
+            fields=[
+                ('token', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='authtoken.token')),
+                ('last_used_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
@@ -1,6 +1,7 @@
 """Models for database"""
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 import uuid
 import os
 from django.contrib.auth.models import (
@@ -46,11 +47,19 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    deletion_requested_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
+    class Meta:
+        indexes = [models.Index(
+            fields=['deletion_requested_at'],
+            name='core_user_pending_deletion',
+            condition=models.Q(deletion_requested_at__isnull=False),
+        )]
+
 
 class Recipe(models.Model):
     """Recipe object"""
@@ -64,16 +73,49 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    updated_at = models.DateTimeField(auto_now=True)
+    # moves on with every change, the API exposes it as the ETag
+    version = models.PositiveIntegerField(default=1)
+    # transaction of the last write, set by a trigger for the sync feed
+    txid = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'txid', 'id']),
+            models.Index(fields=['updated_at']),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """Save the recipe, bumping the version of an existing row"""
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        self.version = models.F('version') + 1
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            # loaded again when read instead of keeping the expression
+            del self.version
+
 
 class Tag(models.Model):
     """Tag for filtring recipes"""
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+    # transaction of the last write, set by a trigger for the sync feed
+    txid = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name']),
+            models.Index(fields=['user', 'txid', 'id']),
+        ]
 
     def __str__(self):
         return self.name
@@ -84,6 +126,88 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+    # transaction of the last write, set by a trigger for the sync feed
+    txid = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'name']),
+            models.Index(fields=['user', 'txid', 'id']),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class Tombstone(models.Model):
+    """Record of a deleted recipe, tag or ingredient for the sync feed"""
+    # no database constraint: the rows written while the user itself is
+    # being deleted must not block the deletion
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, db_constraint=False)
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    # transaction of the deletion, set by a trigger for the sync feed
+    txid = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'txid', 'id'])]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
+
+class Job(models.Model):
+    """Background job run by manage.py run_worker"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True,
+                             blank=True, on_delete=models.SET_NULL)
+    name = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_at', 'id'], name='core_job_queued',
+                         condition=models.Q(status='queued')),
+            models.Index(fields=['locked_at'], name='core_job_running',
+                         condition=models.Q(status='running')),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class TokenUsage(models.Model):
+    """Last time an API token authenticated a request"""
+    # no database constraint: buffered usage may be flushed after the token
+    # was rotated or purged
+    token = models.OneToOneField('authtoken.Token', primary_key=True,
+                                 on_delete=models.CASCADE,
+                                 db_constraint=False, related_name='usage')
+    last_used_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.token_id[:8]}... {self.last_used_at}'
@@ -0,0 +1,131 @@
+"""
+Paginators that avoid counting every row of large tables
+
+Above a threshold a queryset is counted from the planner: the statistics of
+its table when it is unfiltered, the row estimate of EXPLAIN otherwise. The
+exact count is only run when the estimate says it is cheap, so a page costs
+the same whether the user has a hundred or a million rows.
+"""
+import json
+from collections import OrderedDict
+
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+def estimated_count(queryset):
+    """Return the planner's row estimate of the table, None if unknown"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def explain_count(queryset):
+    """Return the rows EXPLAIN expects the queryset to return"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedPage(Page):
+    """Page telling whether more follow from its own length"""
+
+    def has_next(self):
+        if self.paginator.count_is_estimated:
+            return len(self.object_list) >= self.paginator.per_page
+        return super().has_next()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator trading exact totals for constant time counts
+
+    Querysets estimated below estimate_threshold rows are counted exactly,
+    count_is_estimated tells which of the two the count is. Pages of an
+    estimated count are not cut at the estimate, which may be too low.
+    """
+    estimate_threshold = 10000
+    count_is_estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        if queryset.query.where:
+            estimate = explain_count(queryset)
+        else:
+            estimate = estimated_count(queryset)
+        if estimate is not None and estimate >= self.estimate_threshold:
+            self.count_is_estimated = True
+            return estimate
+        return queryset.count()
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.count_is_estimated and int(number) >= 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimated:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page],
+                              number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return EstimatedPage(*args, **kwargs)
+
+
+class EstimatedPageNumberPagination(PageNumberPagination):
+    """Page number pagination reporting whether the count is estimated
+
+    Only applies when the client asks for a page, so clients fetching the
+    whole list keep getting a plain array.
+    """
+    django_paginator_class = EstimatedCountPaginator
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        paginator = self.page.paginator
+        return Response(OrderedDict([
+            ('count', paginator.count),
+            ('count_is_estimated', paginator.count_is_estimated),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        """Document the plain array, and the page object sent for ?page"""
+        paginated = super().get_paginated_response_schema(schema)
+        paginated['properties']['count_is_estimated'] = {'type': 'boolean'}
+        paginated['description'] = 'Page of results, when page is sent'
+        return {'oneOf': [schema, paginated]}
@@ -0,0 +1,173 @@
+"""
+Opt-in per request timing for staff users
+
+ServerTimingMiddleware starts a RequestProfile when the debug header is sent
+to one of the profiled paths, and ServerTimingMixin marks the auth and
+serialization phases inside the DRF views. The Server-Timing header is only
+added once the request turns out to come from a staff user.
+"""
+import cProfile
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection
+
+from core.metrics import QueryTimer
+
+DEBUG_HEADER = 'HTTP_X_DEBUG_TIMING'
+PROFILE_VALUE = 'profile'
+
+_local = threading.local()
+
+
+def current_profile():
+    """Return the profile of the request handled by this thread"""
+    return getattr(_local, 'profile', None)
+
+
+class SlowestQueryTimer(QueryTimer):
+    """Query timer remembering the slowest statement"""
+
+    def __init__(self):
+        super().__init__()
+        self.slowest_sql = ''
+        self.slowest_duration = 0.0
+
+    def record(self, sql, duration):
+        super().record(sql, duration)
+        if duration >= self.slowest_duration:
+            self.slowest_sql = sql
+            self.slowest_duration = duration
+
+
+class RequestProfile:
+    """Time spent in each phase of one request"""
+
+    def __init__(self, want_profile=False):
+        self.start_time = time.perf_counter()
+        self.queries = SlowestQueryTimer()
+        self.want_profile = want_profile
+        self.profiler = None
+        self.durations = {}
+        self._running = {}
+
+    def start(self, phase):
+        """Start timing a phase"""
+        self._running[phase] = (time.perf_counter(), self.queries.duration)
+
+    def stop(self, phase):
+        """Stop timing a phase, the SQL time is accounted to db only"""
+        if phase not in self._running:
+            return
+        started, db_before = self._running.pop(phase)
+        elapsed = time.perf_counter() - started
+        db_time = self.queries.duration - db_before
+        self.durations[phase] = self.durations.get(phase, 0.0) + \
+            max(elapsed - db_time, 0.0)
+
+    def start_profiler(self):
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profiler(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def header(self):
+        """Build the Server-Timing header value"""
+        total = time.perf_counter() - self.start_time
+        entries = [
+            _timing(phase, self.durations[phase])
+            for phase in ('auth', 'serialize', 'render')
+            if phase in self.durations
+        ]
+        entries.append(_timing('db', self.queries.duration,
+                               f'{self.queries.count} queries'))
+        if self.queries.count:
+            entries.append(_timing('sql-slowest',
+                                   self.queries.slowest_duration,
+                                   self.queries.slowest_sql))
+        entries.append(_timing('total', total))
+        return ', '.join(entries)
+
+    def dump_profile(self):
+        """Write the cProfile stats and return the file name"""
+        directory = getattr(settings, 'SERVER_TIMING_PROFILE_DIR', None) or \
+            tempfile.gettempdir()
+        file_name = f'profile-{uuid.uuid4().hex}.prof'
+        self.profiler.dump_stats(os.path.join(directory, file_name))
+        return file_name
+
+
+def _timing(name, seconds, description=None):
+    entry = f'{name};dur={seconds * 1000:.2f}'
+    if description:
+        description = ' '.join(description.split())[:200]
+        description = description.encode('latin-1', 'replace').decode(
+            'latin-1')
+        description = description.replace('\\', '\\\\').replace('"', '\\"')
+        entry += f';desc="{description}"'
+    return entry
+
+
+class ServerTimingMiddleware:
+    """Add Server-Timing to responses of staff requests asking for it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get(DEBUG_HEADER)
+        paths = getattr(settings, 'SERVER_TIMING_PATHS', ())
+        if not mode or not request.path.startswith(tuple(paths)):
+            return self.get_response(request)
+
+        profile = RequestProfile(want_profile=mode == PROFILE_VALUE)
+        _local.profile = profile
+        try:
+            with connection.execute_wrapper(profile.queries):
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+            profile.stop_profiler()
+        profile.stop('render')
+
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_staff:
+            return response
+        response['Server-Timing'] = profile.header()
+        if profile.profiler is not None:
+            response['X-Profile-Dump'] = profile.dump_profile()
+        return response
+
+    def process_template_response(self, request, response):
+        profile = current_profile()
+        if profile is not None:
+            profile.start('render')
+        return response
+
+
+class ServerTimingMixin:
+    """Mark the auth and serialization phases of a DRF view"""
+
+    def initial(self, request, *args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super().initial(request, *args, **kwargs)
+        profile.start('auth')
+        super().initial(request, *args, **kwargs)
+        profile.stop('auth')
+        if profile.want_profile and request.user.is_staff:
+            profile.start_profiler()
+        profile.start('serialize')
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        profile = current_profile()
+        if profile is not None:
+            profile.stop('auth')
+            profile.stop('serialize')
+        return super().finalize_response(request, response, *args, **kwargs)
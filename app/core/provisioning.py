@@ -0,0 +1,103 @@
+"""
+Bulk creation of user accounts
+
+Hashing passwords is what makes creating users slow, so it is done in a
+process pool, one batch of passwords at a time, and each batch of users is
+inserted with one bulk_create, along with their API tokens when asked.
+"""
+import csv
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+BATCH_SIZE = 1000
+
+
+def read_rows(lines):
+    """Yield (email, password, name) from CSV lines with a header row"""
+    for row in csv.DictReader(lines):
+        yield (
+            BaseUserManager.normalize_email((row.get('email') or '').strip()),
+            row.get('password') or None,
+            (row.get('name') or '').strip(),
+        )
+
+
+def hash_passwords(passwords, executor=None, workers=1):
+    """Hash passwords, in parallel when an executor is given"""
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+class ImportResult:
+    """Counts and timing of an import"""
+
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.tokens = []
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        """Users created per second"""
+        elapsed = time.monotonic() - self.started
+        return self.created / elapsed if elapsed else 0.0
+
+
+def _new_rows(batch, seen):
+    """Drop invalid rows, repeated emails and existing users"""
+    rows = []
+    for email, password, name in batch:
+        if '@' not in email or email in seen:
+            continue
+        seen.add(email)
+        rows.append((email, password, name))
+    existing = set(
+        get_user_model().objects
+        .filter(email__in=[email for email, _, _ in rows])
+        .values_list('email', flat=True)
+    )
+    return [row for row in rows if row[0] not in existing]
+
+
+def import_users(rows, batch_size=BATCH_SIZE, create_tokens=False,
+                 executor=None, workers=1, progress=None):
+    """Create the users of (email, password, name) rows in batches
+
+    Rows without a valid email and emails already taken are skipped. Returns an
+    ImportResult, listing (email, token key) pairs when tokens are created.
+    """
+    User = get_user_model()
+    result = ImportResult()
+    seen = set()
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return result
+        new = _new_rows(batch, seen)
+        result.skipped += len(batch) - len(new)
+        hashes = hash_passwords([password for _, password, _ in new],
+                                executor, workers)
+        users = [User(email=email, name=name, password=hashed)
+                 for (email, _, name), hashed in zip(new, hashes)]
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+            if create_tokens:
+                tokens = Token.objects.bulk_create(
+                    [Token(user=user, key=Token.generate_key())
+                     for user in users])
+                result.tokens.extend(
+                    (user.email, token.key)
+                    for user, token in zip(users, tokens))
+        result.created += len(users)
+        if progress is not None:
+            progress(result)
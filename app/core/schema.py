@@ -0,0 +1,143 @@
+"""
+OpenAPI schema generated once per code version and served from disk
+
+The schema files are named after a fingerprint of the project source, so a
+file written by build_schema is reused until the code changes and a stale
+file is never served.
+"""
+import functools
+import hashlib
+import os
+import threading
+
+import drf_spectacular
+import rest_framework
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.module_loading import import_string
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+from core import metrics
+
+RENDERERS = {
+    'yaml': OpenApiYamlRenderer,
+    'json': OpenApiJsonRenderer,
+}
+
+_cache = {}
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint(base_dir):
+    """Hash the project sources and the versions of the schema libraries"""
+    digest = hashlib.sha256()
+    digest.update(drf_spectacular.__version__.encode())
+    digest.update(rest_framework.VERSION.encode())
+    spectacular = sorted(settings.SPECTACULAR_SETTINGS.items())
+    digest.update(repr(spectacular).encode())
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__')))
+        for file_name in sorted(files):
+            if not file_name.endswith('.py'):
+                continue
+            path = os.path.join(root, file_name)
+            digest.update(os.path.relpath(path, base_dir).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def schema_path(fmt):
+    """Return the file holding the schema for the current code"""
+    fingerprint = code_fingerprint(str(settings.BASE_DIR))[:16]
+    return os.path.join(str(settings.SCHEMA_CACHE_DIR),
+                        f'schema-{fingerprint}.{fmt}')
+
+
+def generate_schema(fmt):
+    """Introspect the API and render the schema"""
+    generator_class = spectacular_settings.DEFAULT_GENERATOR_CLASS
+    if isinstance(generator_class, str):
+        generator_class = import_string(generator_class)
+    schema = generator_class().get_schema(request=None, public=True)
+    return RENDERERS[fmt]().render(schema, renderer_context={})
+
+
+def write_schema(fmt):
+    """Generate the schema and write it next to the other cached files"""
+    content = generate_schema(fmt)
+    path = schema_path(fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_schema(fmt):
+    """Return the schema bytes and their ETag, generating them if needed"""
+    key = (str(settings.SCHEMA_CACHE_DIR), fmt)
+    entry = _cache.get(key)
+    if entry is None:
+        with _lock:
+            entry = _cache.get(key)
+            if entry is None:
+                entry = _cache[key] = _load_schema(fmt)
+                return entry
+    metrics.record_cache('openapi_schema', True)
+    return entry
+
+
+def _load_schema(fmt):
+    path = schema_path(fmt)
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        metrics.record_cache('openapi_schema', True)
+    except FileNotFoundError:
+        metrics.record_cache('openapi_schema', False)
+        try:
+            write_schema(fmt)
+            with open(path, 'rb') as f:
+                content = f.read()
+        except OSError:
+            content = generate_schema(fmt)
+    etag = '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+    return content, etag
+
+
+def etag_matches(header, etag):
+    """Tell if an If-None-Match header names the etag, weakly compared"""
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.replace('W/', '', 1) == etag:
+            return True
+    return False
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """Serve the precomputed schema with an ETag"""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        fmt = request.accepted_renderer.format
+        if fmt not in RENDERERS or request.GET.get('lang') or self.urlconf:
+            return super().get(request, *args, **kwargs)
+        content, etag = get_schema(fmt)
+        if etag_matches(request.headers.get('If-None-Match', ''), etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                content,
+                content_type=f'{request.accepted_renderer.media_type}; '
+                             'charset=utf-8',
+            )
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
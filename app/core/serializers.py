@@ -0,0 +1,15 @@
+"""Serializers for the core app"""
+from rest_framework import serializers
+
+from core.models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for the status of a background job"""
+
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'attempts', 'max_attempts',
+                  'run_at', 'created_at', 'finished_at', 'result',
+                  'last_error']
+        read_only_fields = fields
@@ -0,0 +1,60 @@
+"""
+Static files storage writing compressed copies at collectstatic time
+
+Next to every hashed file worth compressing, collectstatic writes a .gz
+and, when brotli is installed, a .br sibling. core.views.serve_static
+sends them as they are, so static files are never compressed per request.
+"""
+import mimetypes
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+from core import compression
+
+# sizes below this gain nothing over the cost of the extra request headers
+MIN_SIZE = 512
+# keep a compressed copy only when it saves more than this
+MAX_RATIO = 0.95
+EXTENSIONS = {'br': 'br', 'gzip': 'gz'}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed static files plus their precompressed siblings"""
+    _hashed_names = None
+
+    def post_process(self, paths, dry_run=False, **options):
+        self._hashed_names = None
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            for compressed in self.compress_file(name):
+                yield name, compressed, True
+
+    def compress_file(self, name):
+        """Write the compressed siblings of a file, return their names"""
+        content_type, _ = mimetypes.guess_type(name)
+        if not compression.is_compressible(content_type):
+            return []
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_SIZE:
+            return []
+        written = []
+        for encoding in compression.available_encodings():
+            compressed = compression.compress(data, encoding, best=True)
+            if len(compressed) > len(data) * MAX_RATIO:
+                continue
+            target = f'{name}.{EXTENSIONS[encoding]}'
+            if self.exists(target):
+                self.delete(target)
+            self._save(target, ContentFile(compressed))
+            written.append(target)
+        return written
+
+    def is_hashed(self, name):
+        """Tell whether the file name contains its content hash"""
+        if self._hashed_names is None:
+            self._hashed_names = set(self.hashed_files.values())
+        return name in self._hashed_names
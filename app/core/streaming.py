@@ -0,0 +1,61 @@
+"""
+Streaming responses for large result sets
+
+Rows are encoded while they are read from the database cursor, either as
+newline delimited JSON or as the fragments of one JSON array, so the memory
+used does not depend on the number of rows.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _encoder():
+    # same output as the compact, unicode JSON of DRF's JSONRenderer
+    return DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def _chunked(pieces, chunk_size):
+    """Group strings into byte chunks of about chunk_size"""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def json_lines(rows, chunk_size=CHUNK_SIZE):
+    """Yield the rows as JSON lines grouped in chunks of about chunk_size"""
+    encode = _encoder().encode
+    return _chunked((encode(row) + '\n' for row in rows), chunk_size)
+
+
+def json_array(rows, chunk_size=CHUNK_SIZE):
+    """Yield the rows as one JSON array, sending the opening bracket first"""
+    encode = _encoder().encode
+    yield b'['
+    pieces = (encode(row) if index == 0 else ',' + encode(row)
+              for index, row in enumerate(rows))
+    yield from _chunked(pieces, chunk_size)
+    yield b']'
+
+
+class JSONLinesResponse(StreamingHttpResponse):
+    """Stream an iterable of JSON serializable rows"""
+
+    def __init__(self, rows, **kwargs):
+        kwargs.setdefault('content_type', 'application/x-ndjson')
+        super().__init__(json_lines(rows), **kwargs)
+
+
+class JSONArrayResponse(StreamingHttpResponse):
+    """Stream an iterable of JSON serializable rows as a JSON array"""
+
+    def __init__(self, rows, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(json_array(rows), **kwargs)
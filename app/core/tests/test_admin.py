@@ -1,8 +1,12 @@
 """Tests that is related to admin"""
+import warnings
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client
+from decimal import Decimal
+from core.models import Recipe, Tag
 
 
 class AdminSiteTests(TestCase):
@@ -38,3 +42,71 @@ class AdminSiteTests(TestCase):
         url = reverse("admin:core_user_add")
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
+
+
+class RecipeAdminTests(TestCase):
+    """testing the recipe, tag and ingredient admin pages"""
+    def setUp(self):
+        self.admin_user = get_user_model().objects.create_superuser(
+            email="adminTest@example.com",
+            password="adminTest1234",
+        )
+        self.client = Client()
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com",
+            password="user1234",
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Pancakes', time_minutes=10,
+            price=Decimal('2.50'))
+        self.unused_tag = Tag.objects.create(user=self.user, name='unused')
+
+    def test_listing_recipes(self):
+        """testing the changelist avoids a query per row"""
+        for i in range(5):
+            Recipe.objects.create(user=self.user, title=f'Recipe {i}',
+                                  time_minutes=5, price=Decimal('1.00'))
+        url = reverse("admin:core_recipe_changelist")
+        self.client.get(url)
+        with self.assertNumQueries(5):
+            res = self.client.get(url)
+        self.assertContains(res, 'Pancakes')
+        self.assertContains(res, self.user.email)
+
+    def test_search_recipes(self):
+        """testing recipes can be searched by title"""
+        url = reverse("admin:core_recipe_changelist")
+        res = self.client.get(url, {'q': 'pancake'})
+        self.assertContains(res, 'Pancakes')
+        res = self.client.get(url, {'q': 'waffle'})
+        self.assertNotContains(res, 'Pancakes')
+
+    def test_change_recipe_uses_autocomplete(self):
+        """testing the change form does not render every tag"""
+        url = reverse("admin:core_recipe_change", args=[self.recipe.id])
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'admin-autocomplete')
+        self.assertNotContains(res, self.unused_tag.name)
+
+    def test_listing_tags(self):
+        """testing the tag changelist and autocomplete search"""
+        res = self.client.get(reverse("admin:core_tag_changelist"))
+        self.assertContains(res, self.unused_tag.name)
+        res = self.client.get(reverse("admin:autocomplete"), {
+            'app_label': 'core', 'model_name': 'recipe',
+            'field_name': 'tags', 'term': 'unu',
+        })
+        self.assertEqual(res.json()['results'][0]['text'], 'unused')
+
+    def test_autocomplete_ordered(self):
+        """testing the autocomplete paginates a stable order"""
+        for field in ('tags', 'ingredients'):
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                res = self.client.get(reverse("admin:autocomplete"), {
+                    'app_label': 'core', 'model_name': 'recipe',
+                    'field_name': field, 'term': '',
+                })
+            self.assertEqual(res.status_code, 200)
@@ -0,0 +1,182 @@
+"""Tests for the coalescing of identical concurrent requests"""
+import threading
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.coalescing import SingleFlight, flights
+from core.models import Recipe
+from recipe import representations
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def run_in_thread(fn, results, index):
+    """Start a thread storing the result of fn in results[index]"""
+    def target():
+        try:
+            results[index] = fn()
+        finally:
+            connection.close()
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+def wait_for_flight(single_flight):
+    """Give the second caller time to join the running flight"""
+    for _ in range(100):
+        if single_flight.in_flight():
+            break
+        time.sleep(0.01)
+    time.sleep(0.1)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Test concurrent calls sharing one computation"""
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def _slow(self, value='done'):
+        def fn():
+            self.calls += 1
+            self.release.wait(5)
+            return value
+        return fn
+
+    def test_concurrent_calls_share_result(self):
+        """Test the second caller waits and reuses the first result"""
+        results = [None, None]
+        first = run_in_thread(
+            lambda: self.flights.do('key', self._slow(), 5), results, 0)
+        wait_for_flight(self.flights)
+        second = run_in_thread(
+            lambda: self.flights.do('key', self._slow(), 5), results, 1)
+        time.sleep(0.1)
+        self.release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [('done', False), ('done', True)])
+        self.assertEqual(self.flights.in_flight(), 0)
+
+    def test_wait_is_bounded(self):
+        """Test a waiter computes on its own once its timeout expires"""
+        results = [None]
+        first = run_in_thread(
+            lambda: self.flights.do('key', self._slow(), 5), results, 0)
+        wait_for_flight(self.flights)
+
+        result = self.flights.do('key', lambda: 'own', 0.05)
+        self.release.set()
+        first.join()
+
+        self.assertEqual(result, ('own', False))
+
+    def test_failure_not_shared(self):
+        """Test waiters compute themselves when the leader raises"""
+        def failing():
+            self.release.wait(5)
+            raise ValueError('boom')
+
+        errors = []
+
+        def leader():
+            try:
+                self.flights.do('key', failing, 5)
+            except ValueError as exc:
+                errors.append(exc)
+        results = [None, None]
+        first = run_in_thread(leader, results, 0)
+        wait_for_flight(self.flights)
+        second = run_in_thread(
+            lambda: self.flights.do('key', lambda: 'own', 5), results, 1)
+        time.sleep(0.1)
+        self.release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(results[1], ('own', False))
+        self.assertEqual(self.flights.in_flight(), 0)
+
+
+class CoalescedListTests(TransactionTestCase):
+    """Test concurrent identical list requests are computed once"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123')
+        for i in range(3):
+            Recipe.objects.create(user=self.user, title=f'Recipe {i}',
+                                  time_minutes=5, price='1.00')
+
+    def _get(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.get(RECIPES_URL)
+
+    def test_identical_lists_computed_once(self):
+        """Test the second request gets the bytes of the first"""
+        release = threading.Event()
+        represent_rows = representations.represent_rows
+        calls = []
+
+        def slow_represent_rows(*args, **kwargs):
+            calls.append(1)
+            release.wait(5)
+            return represent_rows(*args, **kwargs)
+
+        results = [None, None]
+        with patch('recipe.views.representations.represent_rows',
+                   side_effect=slow_represent_rows):
+            first = run_in_thread(self._get, results, 0)
+            wait_for_flight(flights)
+            second = run_in_thread(self._get, results, 1)
+            time.sleep(0.1)
+            release.set()
+            first.join()
+            second.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0].status_code, 200)
+        self.assertEqual(results[1].status_code, 200)
+        self.assertEqual(results[0].content, results[1].content)
+        self.assertEqual(len(results[1].json()), 3)
+
+    def test_read_after_write_not_shared(self):
+        """Test a read sent after a write does not join an older read"""
+        release = threading.Event()
+        represent_rows = representations.represent_rows
+
+        def slow_represent_rows(*args, **kwargs):
+            release.wait(5)
+            return represent_rows(*args, **kwargs)
+
+        results = [None, None]
+        with patch('recipe.views.representations.represent_rows',
+                   side_effect=slow_represent_rows):
+            first = run_in_thread(self._get, results, 0)
+            wait_for_flight(flights)
+            client = APIClient()
+            client.force_authenticate(self.user)
+            recipe = Recipe.objects.filter(user=self.user).first()
+            client.patch(reverse('recipe:recipe-detail', args=[recipe.id]),
+                         {'title': 'Changed'})
+            second = run_in_thread(self._get, results, 1)
+            time.sleep(0.1)
+            release.set()
+            first.join()
+            second.join()
+
+        self.assertNotIn('Changed', results[0].content.decode())
+        self.assertIn('Changed', results[1].content.decode())
@@ -2,31 +2,70 @@
 test custom Django management command
 """
 
-from unittest.mock import patch
+from unittest.mock import patch, call
 from psycopg2 import OperationalError as Psycopg2Error
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import SimpleTestCase
 
 
-@patch('core.management.commands.wait_for_db.Command.check')
+@patch('core.management.commands.wait_for_db.Command.ping')
 class CommandTests(SimpleTestCase):
     """testing commands"""
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_ping):
         """ tests if the command can handle when database is ready"""
-        patched_check.return_value = True  # mocked check return True
+        patched_ping.return_value = None
 
         call_command('wait_for_db')  # as if it called from the cmd
 
-        patched_check.assert_called_once_with(databases=['default'])
+        patched_ping.assert_called_once_with('default')
 
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+    def test_wait_for_db_delay(self, patched_sleep, patched_ping):
         """tests what happens when the database isn't ready immediately"""
-        patched_check.side_effect = [Psycopg2Error] * 2 + \
-            [OperationalError] * 3 + [True]
+        patched_ping.side_effect = [Psycopg2Error] * 2 + \
+            [OperationalError] * 3 + [None]
 
         call_command('wait_for_db')
 
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
+        self.assertEqual(patched_ping.call_count, 6)
+        patched_ping.assert_called_with('default')
+        patched_sleep.assert_has_calls(
+            [call(0.05), call(0.1), call(0.2), call(0.4), call(0.8)])
+
+    @patch('time.sleep')
+    def test_wait_for_db_backoff_capped(self, patched_sleep, patched_ping):
+        """tests the delay between attempts stops growing"""
+        patched_ping.side_effect = [OperationalError] * 10 + [None]
+
+        call_command('wait_for_db')
+
+        self.assertEqual(patched_sleep.call_args_list[-1], call(2))
+
+    @patch('time.sleep')
+    def test_wait_for_db_deadline(self, patched_sleep, patched_ping):
+        """tests the command gives up after the timeout"""
+        patched_ping.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', timeout=0)
+
+        patched_sleep.assert_not_called()
+
+    @patch('core.management.commands.wait_for_db.Command.pending_migrations')
+    def test_require_migrated_ready(self, patched_pending, patched_ping):
+        """tests the command succeeds when nothing is pending"""
+        patched_pending.return_value = []
+
+        call_command('wait_for_db', require_migrated=True)
+
+        patched_pending.assert_called_once_with('default')
+
+    @patch('core.management.commands.wait_for_db.Command.pending_migrations')
+    def test_require_migrated_pending(self, patched_pending, patched_ping):
+        """tests the command fails when migrations are pending"""
+        patched_pending.return_value = [('migration', False)]
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', require_migrated=True, timeout=0)
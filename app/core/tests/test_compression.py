@@ -0,0 +1,191 @@
+"""Tests for response compression and precompressed static files"""
+import gzip
+import json
+import os
+import tempfile
+import zlib
+from unittest import skipIf
+
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import compression
+from core.compression import CompressionMiddleware
+from core.views import serve_static
+
+
+def json_response(size):
+    """Return a JSON response of about size bytes"""
+    body = json.dumps([{'title': 'Recipe'}] * (size // 19))
+    return HttpResponse(body, content_type='application/json')
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test the compression of responses"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _get(self, response, accept='gzip'):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(
+            self.factory.get('/', HTTP_ACCEPT_ENCODING=accept))
+
+    def test_choose_encoding(self):
+        """Test the quality values of Accept-Encoding are respected"""
+        self.assertEqual(compression.choose_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(compression.choose_encoding('gzip;q=0'))
+        self.assertIsNone(compression.choose_encoding(''))
+        self.assertEqual(
+            compression.choose_encoding('br;q=0.5, gzip', ['br', 'gzip']),
+            'gzip')
+        self.assertEqual(
+            compression.choose_encoding('*', ['br', 'gzip']), 'br')
+
+    def test_large_json_compressed(self):
+        """Test large JSON responses are gzipped"""
+        original = json_response(5000)
+        body = original.content
+        res = self._get(original)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res['Vary'])
+        self.assertEqual(int(res['Content-Length']), len(res.content))
+        self.assertEqual(gzip.decompress(res.content), body)
+
+    def test_small_response_not_compressed(self):
+        """Test responses under the size threshold are sent as they are"""
+        res = self._get(json_response(100))
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_not_accepted_or_not_compressible(self):
+        """Test compression needs the client and a text content type"""
+        res = self._get(json_response(5000), accept='identity')
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+        image = HttpResponse(b'x' * 5000, content_type='image/jpeg')
+        self.assertFalse(self._get(image).has_header('Content-Encoding'))
+
+    def test_streaming_compressed(self):
+        """Test streaming responses are compressed chunk by chunk"""
+        chunks = [b'[', b'{"id":1}' * 100, b']']
+        res = self._get(StreamingHttpResponse(
+            iter(chunks), content_type='application/json'))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(res.streaming_content)),
+                         b''.join(chunks))
+
+    def test_streaming_flushes_every_chunk(self):
+        """Test the first chunk can be decompressed before the rest"""
+        def chunks():
+            yield b'['
+            raise AssertionError('the first chunk waited for the next')
+
+        stream = compression.compress_stream(chunks(), 'gzip')
+
+        decompressor = zlib.decompressobj(wbits=31)
+        self.assertEqual(decompressor.decompress(next(stream)), b'[')
+
+    def test_etag_weakened(self):
+        """Test a strong ETag becomes weak once the body is compressed"""
+        response = json_response(5000)
+        response['ETag'] = '"abc"'
+
+        self.assertEqual(self._get(response)['ETag'], 'W/"abc"')
+
+    @skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        """Test brotli is used when installed and accepted"""
+        original = json_response(5000)
+        body = original.content
+        res = self._get(original, accept='gzip, br')
+
+        self.assertEqual(res['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(res.content), body)
+
+
+class PrecompressedStaticTests(SimpleTestCase):
+    """Test collectstatic writes compressed files that are served as is"""
+
+    def setUp(self):
+        self.source = tempfile.TemporaryDirectory()
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.source.cleanup)
+        self.addCleanup(self.root.cleanup)
+        with open(os.path.join(self.source.name, 'app.css'), 'w') as f:
+            f.write('body { color: black; }\n' * 100)
+        with open(os.path.join(self.source.name, 'tiny.css'), 'w') as f:
+            f.write('p {}\n')
+        self.settings = override_settings(
+            STATIC_ROOT=self.root.name,
+            STATICFILES_DIRS=[self.source.name],
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder',
+            ],
+            STATICFILES_STORAGE=(
+                'core.storage.CompressedManifestStaticFilesStorage'),
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root.name, 'staticfiles.json')) as f:
+            self.manifest = json.load(f)['paths']
+
+    def _get(self, path, accept='gzip'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept)
+        return serve_static(request, path)
+
+    def test_compressed_siblings_written(self):
+        """Test large text files get a .gz, small ones are left alone"""
+        hashed = self.manifest['app.css']
+        path = os.path.join(self.root.name, hashed)
+        with open(path, 'rb') as f, open(path + '.gz', 'rb') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), f.read())
+        self.assertFalse(os.path.exists(os.path.join(
+            self.root.name, self.manifest['tiny.css'] + '.gz')))
+
+    def test_serve_precompressed(self):
+        """Test the .gz sibling is sent with far future cache headers"""
+        hashed = self.manifest['app.css']
+        res = self._get(hashed)
+        body = b''.join(res.streaming_content)
+        res.close()
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(res['Content-Type'], 'text/css')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('Accept-Encoding', res['Vary'])
+        self.assertEqual(gzip.decompress(body).decode(),
+                         'body { color: black; }\n' * 100)
+
+    def test_serve_uncompressed(self):
+        """Test clients without gzip and unhashed names get the original"""
+        res = self._get('app.css', accept='identity')
+        res.close()
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertNotIn('immutable', res['Cache-Control'])
+
+    def test_static_not_compressed_again(self):
+        """Test files without a compressed sibling are sent as they are"""
+        path = self.manifest['tiny.css']
+        middleware = CompressionMiddleware(
+            lambda request: serve_static(request, path))
+
+        res = middleware(RequestFactory().get('/',
+                                              HTTP_ACCEPT_ENCODING='gzip'))
+        body = b''.join(res.streaming_content)
+        res.close()
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(body, b'p {}\n')
+
+    def test_missing_file(self):
+        """Test unknown paths and paths outside STATIC_ROOT are 404"""
+        for path in ['missing.css', '../etc/passwd']:
+            res = self.client.get(f'/static/static/{path}')
+            self.assertEqual(res.status_code, 404)
@@ -0,0 +1,85 @@
+"""Tests for the background deletion of users"""
+import os
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from core import deletion
+from core.models import Recipe, Tag, Ingredient, Tombstone
+
+
+def create_user(email):
+    """Create and return a user"""
+    return get_user_model().objects.create_user(email=email,
+                                                password='user1234')
+
+
+def create_recipe(user, **params):
+    """Create and return a recipe"""
+    return Recipe.objects.create(user=user, title='title', time_minutes=5,
+                                 price=Decimal('5.50'), **params)
+
+
+class DeletionTests(TestCase):
+    """Test deactivating and purging users"""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.other = create_user('other@example.com')
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+
+    def test_request_deletion(self):
+        """Test the account is deactivated and the purge queued"""
+        Token.objects.create(user=self.user)
+        job = deletion.request_deletion(self.user)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deletion_requested_at)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(job.name, 'core.deletion.purge_user')
+        self.assertEqual(job.payload, {'user_id': self.user.id})
+        self.assertEqual(list(deletion.pending_users()), [self.user.id])
+
+    def test_purge_user_in_chunks(self):
+        """Test all the data of the user goes, chunk by chunk"""
+        tags = [Tag.objects.create(user=self.user, name=f'tag{i}')
+                for i in range(3)]
+        ingredient = Ingredient.objects.create(user=self.user, name='salt')
+        with override_settings(MEDIA_ROOT=self.media.name):
+            recipes = [create_recipe(self.user) for _ in range(5)]
+            recipes[0].image.save('image.jpg', ContentFile(b'jpeg'))
+            image_path = recipes[0].image.path
+        for recipe in recipes:
+            recipe.tags.add(*tags)
+            recipe.ingredients.add(ingredient)
+        other_recipe = create_recipe(self.other)
+        other_recipe.tags.add(Tag.objects.create(user=self.other, name='x'))
+        Tombstone.objects.create(user=self.user, kind='recipe', object_id=1)
+
+        with override_settings(MEDIA_ROOT=self.media.name), \
+                patch('time.sleep') as patched_sleep:
+            deleted = deletion.purge_user(self.user.id, chunk_size=2)
+
+        self.assertEqual(deleted, {'recipe': 5, 'tag': 3, 'ingredient': 1,
+                                   'tombstone': 1})
+        self.assertEqual(patched_sleep.call_count, 3)
+        self.assertFalse(
+            get_user_model().objects.filter(id=self.user.id).exists())
+        self.assertFalse(os.path.exists(image_path))
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+        self.assertEqual(Recipe.ingredients.through.objects.count(), 0)
+        self.assertEqual(list(Recipe.objects.all()), [other_recipe])
+
+    @patch('core.deletion.purge_user')
+    def test_purge_command(self, patched_purge):
+        """Test the command resumes the pending purges"""
+        deletion.request_deletion(self.user)
+        call_command('purge_deleted_users', chunk_size=10, pause=0)
+        patched_purge.assert_called_once_with(self.user.id, 10, 0)
@@ -0,0 +1,64 @@
+"""Tests for the bulk import of users"""
+import csv
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+
+from core import provisioning
+
+CSV = """email,password,name
+first@EXAMPLE.com,pass1234,First
+second@example.com,,Second
+not-an-email,pass1234,Invalid
+first@example.com,other123,Again
+existing@example.com,pass1234,Existing
+"""
+
+
+class ImportUsersTests(TestCase):
+    """Test users created in batches with hashed passwords"""
+
+    def setUp(self):
+        get_user_model().objects.create_user(
+            email='existing@example.com', password='test123')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'users.csv')
+        with open(self.path, 'w') as f:
+            f.write(CSV)
+
+    def test_import_users(self):
+        """Test new users are created and the others skipped"""
+        result = provisioning.import_users(
+            provisioning.read_rows(StringIO(CSV)), batch_size=2)
+
+        self.assertEqual((result.created, result.skipped), (2, 3))
+        first = get_user_model().objects.get(email='first@example.com')
+        self.assertEqual(first.name, 'First')
+        self.assertTrue(first.check_password('pass1234'))
+        second = get_user_model().objects.get(email='second@example.com')
+        self.assertFalse(second.has_usable_password())
+        self.assertFalse(Token.objects.exists())
+
+    def test_command_with_process_pool_and_tokens(self):
+        """Test the command hashes in worker processes and writes tokens"""
+        tokens_path = os.path.join(self.tmp_dir.name, 'tokens.csv')
+        out = StringIO()
+
+        call_command('import_users', self.path, '--workers', '2',
+                     '--tokens', tokens_path, stdout=out)
+
+        self.assertIn('Created 2 users, skipped 3', out.getvalue())
+        user = get_user_model().objects.get(email='first@example.com')
+        self.assertTrue(user.check_password('pass1234'))
+        with open(tokens_path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 2)
+        for row in rows:
+            token = Token.objects.get(key=row['token'])
+            self.assertEqual(token.user.email, row['email'])
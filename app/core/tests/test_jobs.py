@@ -0,0 +1,139 @@
+"""Tests for the background job queue"""
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import Job
+
+calls = []
+
+
+def add(a, b):
+    """Job used by the tests"""
+    calls.append((a, b))
+    return a + b
+
+
+def fail():
+    """Job failing every time"""
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    """Test claiming and running jobs"""
+
+    def test_claim_due_jobs(self):
+        """Test only due queued jobs are claimed, oldest first"""
+        first = jobs.enqueue('core.tests.test_jobs.add', {'a': 1, 'b': 2})
+        second = jobs.enqueue('core.tests.test_jobs.add', {'a': 3, 'b': 4})
+        jobs.enqueue('core.tests.test_jobs.add', {'a': 5, 'b': 6}, delay=60)
+        self.assertEqual(jobs.claim('worker', limit=1), [first.id])
+        self.assertEqual(jobs.claim('worker', limit=5), [second.id])
+        self.assertEqual(jobs.claim('worker', limit=5), [])
+        first.refresh_from_db()
+        self.assertEqual(first.status, Job.RUNNING)
+        self.assertEqual(first.attempts, 1)
+        self.assertEqual(first.locked_by, 'worker')
+
+    def test_execute_success(self):
+        """Test the result of a job is recorded"""
+        job = jobs.enqueue('core.tests.test_jobs.add', {'a': 1, 'b': 2})
+        jobs.claim('worker')
+        self.assertEqual(jobs.execute(job.id), Job.SUCCEEDED)
+        job.refresh_from_db()
+        self.assertEqual(job.result, 3)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_execute_retries_with_backoff(self):
+        """Test a failing job is retried later, then failed"""
+        job = jobs.enqueue('core.tests.test_jobs.fail', max_attempts=2)
+        jobs.claim('worker')
+        self.assertEqual(jobs.execute(job.id), Job.QUEUED)
+        job.refresh_from_db()
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        jobs.claim('worker')
+        self.assertEqual(jobs.execute(job.id), Job.FAILED)
+
+    def test_retry_delay_capped(self):
+        """Test the backoff doubles up to a maximum"""
+        self.assertEqual([jobs.retry_delay(n) for n in (1, 2, 3)],
+                         [5, 10, 20])
+        self.assertEqual(jobs.retry_delay(50), jobs.MAX_RETRY_DELAY)
+
+    def test_requeue_stale(self):
+        """Test jobs of lost workers are released"""
+        retried = jobs.enqueue('core.tests.test_jobs.add', {'a': 1, 'b': 2})
+        exhausted = jobs.enqueue('core.tests.test_jobs.add',
+                                 {'a': 1, 'b': 2}, max_attempts=1)
+        jobs.claim('worker', limit=2)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(jobs.requeue_stale(), 2)
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retried.status, Job.QUEUED)
+        self.assertEqual(exhausted.status, Job.FAILED)
+
+    def test_heartbeat_keeps_job(self):
+        """Test a job its worker still reports on is not released"""
+        job = jobs.enqueue('core.tests.test_jobs.add', {'a': 1, 'b': 2})
+        jobs.claim('worker')
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(jobs.heartbeat('other', [job.id]), 0)
+        self.assertEqual(jobs.heartbeat('worker', [job.id]), 1)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+
+
+class WorkerCommandTests(TransactionTestCase):
+    """Test the worker runs the queue from its pool"""
+
+    def test_run_worker_burst(self):
+        """Test the worker runs every queued job then exits"""
+        calls.clear()
+        for i in range(5):
+            jobs.enqueue('core.tests.test_jobs.add', {'a': i, 'b': 1})
+        with patch('signal.signal'), \
+                patch.object(jobs, 'HEARTBEAT_INTERVAL', 0):
+            call_command('run_worker', burst=True, concurrency=2,
+                         stdout=StringIO())
+        self.assertEqual(sorted(calls), [(i, 1) for i in range(5)])
+        self.assertEqual(
+            Job.objects.filter(status=Job.SUCCEEDED).count(), 5)
+
+
+class JobApiTests(TestCase):
+    """Test the job status endpoint"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='user1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_job_status(self):
+        """Test users see their own jobs only"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='other1234')
+        job = jobs.enqueue('core.tests.test_jobs.add', {'a': 1, 'b': 2},
+                           user=self.user)
+        other_job = jobs.enqueue('core.tests.test_jobs.add', user=other)
+        res = self.client.get(reverse('core:job-detail', args=[job.id]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], Job.QUEUED)
+        res = self.client.get(reverse('core:job-detail',
+                                      args=[other_job.id]))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        res = self.client.get(reverse('core:job-list'))
+        self.assertEqual([item['id'] for item in res.data], [job.id])
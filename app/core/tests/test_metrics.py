@@ -0,0 +1,137 @@
+"""
+Tests for the metrics middleware and endpoint
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Recipe
+
+METRICS_URL = reverse('metrics')
+
+
+class MetricsEndpointTests(TestCase):
+    """Test metrics recorded for API requests"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            METRICS_DIR=self.tmp_dir.name)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+
+    def test_request_labelled_by_viewset_action(self):
+        """Test latency, queries and size are labelled by viewset action"""
+        Recipe.objects.create(user=self.user, title='title',
+                              time_minutes=5, price=Decimal('5.50'))
+        self.client.get(reverse('recipe:recipe-list'))
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        body = res.content.decode()
+        self.assertIn('http_requests_total{method="GET",'
+                      'status="200",view="RecipeViewSet.list"} 1', body)
+        self.assertIn('http_request_duration_seconds_count'
+                      '{view="RecipeViewSet.list"} 1', body)
+        self.assertIn('http_response_size_bytes_count'
+                      '{view="RecipeViewSet.list"} 1', body)
+        self.assertIn('db_queries_total{view="RecipeViewSet.list"}', body)
+
+    def test_metrics_written_to_process_file(self):
+        """Test samples go to the mmap file of the current process"""
+        self.client.get(reverse('recipe:tag-list'))
+
+        path = os.path.join(self.tmp_dir.name, f'metrics-{os.getpid()}.db')
+        self.assertTrue(os.path.exists(path))
+
+    def test_metrics_restricted_to_allowed_ips(self):
+        """Test other addresses need a staff user to read the metrics"""
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(res.status_code, 403)
+
+        staff = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='admin1234')
+        self.client.force_login(staff)
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(res.status_code, 200)
+
+
+class RegistryTests(SimpleTestCase):
+    """Test aggregation of metric values"""
+
+    def test_files_of_all_processes_merged(self):
+        """Test values written by several processes are summed"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for pid in (100, 200):
+                store = metrics.MmapValues(
+                    os.path.join(tmp_dir, f'metrics-{pid}.db'))
+                store.add('["cache_requests_total", []]', 2)
+
+            samples = metrics.Registry(tmp_dir).samples()
+
+        self.assertEqual(samples['["cache_requests_total", []]'], 4)
+
+    def test_files_of_exited_processes_folded(self):
+        """Test the file of a dead process is merged into one file"""
+        child = subprocess.Popen([sys.executable, '-c', ''])
+        child.wait()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for pid in (child.pid, os.getpid()):
+                store = metrics.MmapValues(
+                    os.path.join(tmp_dir, f'metrics-{pid}.db'))
+                store.add('["cache_requests_total", []]', 2)
+            registry = metrics.Registry(tmp_dir)
+
+            first = registry.samples()
+            second = registry.samples()
+            files = sorted(name for name in os.listdir(tmp_dir)
+                           if name.endswith('.db'))
+
+        self.assertEqual(first['["cache_requests_total", []]'], 4)
+        self.assertEqual(second, first)
+        self.assertEqual(files, sorted([f'metrics-{os.getpid()}.db',
+                                        'metrics-dead.db']))
+
+    def test_mmap_file_grows(self):
+        """Test the file is resized when keys do not fit"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'metrics-1.db')
+            store = metrics.MmapValues(path)
+            for i in range(5000):
+                store.add(f'key-{i}', i)
+            store.add('key-10', 1)
+
+            values = dict(metrics._read_file(path))
+
+        self.assertEqual(len(values), 5000)
+        self.assertEqual(values['key-10'], 11)
+
+    @override_settings(METRICS_DIR=None)
+    def test_histogram_rendered_cumulative(self):
+        """Test histogram buckets are cumulative in the exposition"""
+        metrics._registry = None
+        metrics.observe('recipe_image_upload_bytes', 100)
+        metrics.observe('recipe_image_upload_bytes', 2000)
+
+        body = metrics.render()
+
+        self.assertIn('recipe_image_upload_bytes_bucket{le="256"} 1', body)
+        self.assertIn('recipe_image_upload_bytes_bucket{le="4096"} 2', body)
+        self.assertIn('recipe_image_upload_bytes_bucket{le="+Inf"} 2', body)
+        self.assertIn('recipe_image_upload_bytes_sum 2100', body)
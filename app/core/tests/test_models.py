@@ -1,6 +1,7 @@
 """
 test models
 """
+from django.db import DataError, transaction
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from core import models
@@ -69,6 +70,18 @@ class ModelTest(TestCase):
         )
         self.assertEqual(str(recipe), recipe.title)
 
+    def test_failed_recipe_save_keeps_version(self):
+        """Test a save that fails leaves no expression on the recipe"""
+        recipe = models.Recipe.objects.create(
+            user=create_user(), title='title', time_minutes=5,
+            price=Decimal('5.50'))
+        recipe.price = Decimal('12345.00')
+
+        with self.assertRaises(DataError), transaction.atomic():
+            recipe.save()
+
+        self.assertEqual(recipe.version, 1)
+
     def test_creating_tag_suc(self):
         """Test creating a tag succeed"""
         user = create_user()
@@ -0,0 +1,59 @@
+"""Tests for the estimated count paginator"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Recipe
+from core.pagination import EstimatedCountPaginator
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    """Test counting pages without counting rows"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='user1234')
+        Recipe.objects.bulk_create([
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=5,
+                   price=Decimal('1.00'))
+            for i in range(30)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_recipe')
+
+    def test_small_table_counted_exactly(self):
+        """Test tables below the threshold get an exact count"""
+        paginator = EstimatedCountPaginator(Recipe.objects.order_by('id'), 10)
+        self.assertEqual(paginator.count, 30)
+        self.assertEqual(paginator.num_pages, 3)
+
+    def test_large_table_estimated(self):
+        """Test an unfiltered queryset is counted from the statistics"""
+        paginator = EstimatedCountPaginator(Recipe.objects.order_by('id'), 10)
+        paginator.estimate_threshold = 1
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 30)
+        self.assertIn('reltuples', queries[0]['sql'])
+        self.assertNotIn('COUNT', queries[0]['sql'])
+
+    def test_filtered_count_explained(self):
+        """Test a filtered queryset is counted from the EXPLAIN estimate"""
+        queryset = Recipe.objects.filter(title__startswith='Recipe') \
+            .order_by('id')
+        paginator = EstimatedCountPaginator(queryset, 10)
+        paginator.estimate_threshold = 1
+        with CaptureQueriesContext(connection) as queries:
+            count = paginator.count
+        self.assertTrue(paginator.count_is_estimated)
+        self.assertGreater(count, 0)
+        self.assertTrue(queries[0]['sql'].startswith('EXPLAIN'))
+
+    def test_filtered_count_exact_below_threshold(self):
+        """Test a small filtered queryset gets an exact count"""
+        paginator = EstimatedCountPaginator(
+            Recipe.objects.filter(title='Recipe 1').order_by('id'), 10)
+        self.assertEqual(paginator.count, 1)
+        self.assertFalse(paginator.count_is_estimated)
@@ -0,0 +1,64 @@
+"""
+Tests for the Server-Timing instrumentation
+"""
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class ServerTimingTests(TestCase):
+    """Test Server-Timing headers on API responses"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = get_user_model().objects.create_user(
+            email='staff@example.com', password='staff1234', is_staff=True)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='user1234')
+
+    def test_staff_with_header_gets_timing(self):
+        """Test staff requests with the debug header are timed"""
+        self.client.force_authenticate(self.staff)
+
+        res = self.client.get(RECIPES_URL, HTTP_X_DEBUG_TIMING='1')
+
+        timing = res['Server-Timing']
+        for phase in ('auth;dur=', 'serialize;dur=', 'render;dur=',
+                      'db;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+        self.assertIn('queries"', timing)
+        self.assertIn('sql-slowest;dur=', timing)
+
+    def test_no_header_no_timing(self):
+        """Test requests without the debug header are not timed"""
+        self.client.force_authenticate(self.staff)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    def test_non_staff_no_timing(self):
+        """Test the header is ignored for non staff users"""
+        self.client.force_authenticate(self.user)
+
+        res = self.client.get(reverse('user:me'), HTTP_X_DEBUG_TIMING='1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Server-Timing', res)
+
+    def test_profile_dump_written(self):
+        """Test the cProfile dump is written when asked for"""
+        self.client.force_authenticate(self.staff)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with override_settings(SERVER_TIMING_PROFILE_DIR=tmp_dir):
+                res = self.client.get(RECIPES_URL,
+                                      HTTP_X_DEBUG_TIMING='profile')
+
+            self.assertTrue(os.path.exists(
+                os.path.join(tmp_dir, res['X-Profile-Dump'])))
@@ -0,0 +1,79 @@
+"""
+Tests for the precomputed OpenAPI schema
+"""
+import os
+from io import StringIO
+import tempfile
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core import schema
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class CachedSchemaTests(SimpleTestCase):
+    """Test serving the schema from the cache"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            SCHEMA_CACHE_DIR=self.tmp_dir.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+
+    def test_schema_served_with_etag(self):
+        """Test the schema is generated once and served with an ETag"""
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'/api/recipe/recipes/', res.content)
+        self.assertTrue(res['ETag'])
+        self.assertTrue(os.path.exists(schema.schema_path('yaml')))
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match returns 304"""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_if_none_match_list(self):
+        """Test If-None-Match is matched tag by tag"""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        for header, status in [(f'"old", W/{etag}', 304), ('*', 304),
+                               (f'"{etag[1:-1]}-old"', 200)]:
+            res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(res.status_code, status, header)
+
+    def test_json_schema(self):
+        """Test the JSON format is cached separately"""
+        res = self.client.get(SCHEMA_URL,
+                              HTTP_ACCEPT='application/vnd.oai.openapi+json')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['openapi'], '3.0.3')
+
+    def test_built_schema_served(self):
+        """Test the file written by build_schema is served as is"""
+        call_command('build_schema', stdout=StringIO())
+        with open(schema.schema_path('yaml'), 'wb') as f:
+            f.write(b'openapi: prebuilt\n')
+
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.content, b'openapi: prebuilt\n')
+
+    def test_docs_use_cached_schema(self):
+        """Test Swagger UI points to the cached schema"""
+        res = self.client.get(reverse('api-docs'))
+
+        self.assertContains(res, SCHEMA_URL)
@@ -0,0 +1,36 @@
+"""Tests for the streaming responses"""
+import json
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from core.streaming import json_array, json_lines, JSONLinesResponse
+
+
+class StreamingTests(SimpleTestCase):
+    """Test encoding rows as JSON lines"""
+
+    def test_rows_grouped_in_chunks(self):
+        """Test small rows are sent together"""
+        rows = [{'id': i} for i in range(100)]
+        chunks = list(json_lines(rows, chunk_size=100))
+        self.assertGreater(len(chunks), 1)
+        self.assertLess(len(chunks), len(rows))
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], rows)
+
+    def test_response(self):
+        """Test the response streams Django types"""
+        res = JSONLinesResponse(iter([{'price': Decimal('5.50')}]))
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(b''.join(res.streaming_content),
+                         b'{"price":"5.50"}\n')
+
+    def test_json_array(self):
+        """Test the fragments join into one JSON array"""
+        rows = [{'id': i, 'name': 'Café'} for i in range(50)]
+        chunks = list(json_array(iter(rows), chunk_size=100))
+        self.assertEqual(chunks[0], b'[')
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(json.loads(b''.join(chunks)), rows)
+        self.assertEqual(b''.join(json_array([])), b'[]')
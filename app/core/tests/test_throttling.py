@@ -0,0 +1,162 @@
+"""Tests for the throttles and the load shedding middleware"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, \
+    override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from core import metrics, throttling
+from core.throttling import (
+    ConcurrencyLimiter,
+    ConcurrencyThrottle,
+    LoadSheddingMiddleware,
+    LoginBucketThrottle,
+    QueueTimeShedder,
+    TokenBucketThrottle,
+    UserBucketThrottle,
+    queue_time,
+)
+from recipe.views import RecipeViewSet
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+class ThrottleTests(TestCase):
+    """Test the token bucket throttles"""
+
+    def setUp(self):
+        caches['throttle'].clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123')
+        self.client = APIClient()
+        self.now = 1000.0
+        timer = patch.object(TokenBucketThrottle, 'timer',
+                             side_effect=lambda: self.now)
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    @patch.object(UserBucketThrottle, 'rate', '2/min', create=True)
+    def test_user_bucket_refills(self):
+        """Test a user bursts up to the rate, then gets one per refill"""
+        self.client.force_authenticate(self.user)
+        codes = [self.client.get(RECIPES_URL).status_code for _ in range(3)]
+
+        self.assertEqual(codes, [200, 200, 429])
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res['Retry-After'], '30')
+        self.assertIn('http_rejected_requests_total{reason="user",'
+                      'view="RecipeViewSet.list"}', metrics.render())
+
+        self.now += 30
+        self.assertEqual(self.client.get(RECIPES_URL).status_code, 200)
+        self.assertEqual(self.client.get(RECIPES_URL).status_code, 429)
+
+    @patch.object(UserBucketThrottle, 'rate', '1/min', create=True)
+    def test_users_have_own_buckets(self):
+        """Test one user running out does not throttle another"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.client.get(RECIPES_URL)
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.client.get(RECIPES_URL).status_code, 200)
+
+    @patch.object(LoginBucketThrottle, 'rate', '2/min', create=True)
+    def test_login_throttled_per_email(self):
+        """Test password checks for one email are limited"""
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        codes = [self.client.post(TOKEN_URL, payload).status_code
+                 for _ in range(3)]
+
+        self.assertEqual(codes, [400, 400, 429])
+        res = self.client.post(TOKEN_URL, {'email': 'other@example.com',
+                                           'password': 'wrong'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LoadSheddingTests(SimpleTestCase):
+    """Test the concurrency cap and the queue time shedding"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        limiter = patch.object(throttling, 'limiter', ConcurrencyLimiter())
+        limiter.start()
+        self.addCleanup(limiter.stop)
+
+    def test_queue_time_header_formats(self):
+        """Test seconds, milliseconds and microseconds are understood"""
+        now = 1700000001.0
+        for header in ['t=1700000000.5', '1700000000500',
+                       '1700000000500000']:
+            request = self.factory.get('/', HTTP_X_REQUEST_START=header)
+            self.assertAlmostEqual(queue_time(request, now), 0.5, places=3)
+        self.assertIsNone(queue_time(self.factory.get('/'), now))
+
+    def test_shed_only_standing_queue(self):
+        """Test shedding starts when queue time stays high an interval"""
+        shedder = QueueTimeShedder(target=1.0, interval=5.0)
+
+        self.assertFalse(shedder.should_shed(2.0, now=100))
+        self.assertFalse(shedder.should_shed(2.0, now=103))
+        self.assertFalse(shedder.should_shed(0.1, now=104))
+        self.assertFalse(shedder.should_shed(2.0, now=106))
+        self.assertTrue(shedder.should_shed(2.0, now=111))
+
+    @override_settings(LOAD_SHED_QUEUE_TIME=1.0, LOAD_SHED_INTERVAL=0)
+    def test_overloaded_request_rejected(self):
+        """Test a request that queued too long gets a 503"""
+        middleware = LoadSheddingMiddleware(lambda request: HttpResponse())
+        request = self.factory.get('/', HTTP_X_REQUEST_START='t=1.0')
+
+        res = middleware(request)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '0')
+
+    @override_settings(CONCURRENCY_LIMIT_PER_CLIENT=2,
+                       CONCURRENCY_LIMITED_VIEWS=['RecipeViewSet.list'])
+    def test_concurrent_expensive_requests_capped(self):
+        """Test a client runs a bounded number of expensive requests"""
+        users = [get_user_model()(pk=1), get_user_model()(pk=2)]
+        view = RecipeViewSet(action='list')
+
+        def start(user=None, **headers):
+            request = self.factory.get(RECIPES_URL, **headers)
+            drf_request = Request(request)
+            if user is not None:
+                drf_request.user = user
+            allowed = ConcurrencyThrottle().allow_request(drf_request, view)
+            return request, allowed
+
+        running = [start(users[0]), start(users[0])]
+        self.assertFalse(start(users[0])[1])
+        self.assertTrue(start(users[1])[1])
+        self.assertTrue(start(HTTP_AUTHORIZATION='Token a')[1])
+        self.assertTrue(start(HTTP_AUTHORIZATION='Token b')[1])
+        self.assertFalse(start(HTTP_AUTHORIZATION='Token c')[1])
+        for request, _ in running:
+            throttling.limiter.release(request.concurrency_client)
+        self.assertTrue(start(users[0])[1])
+
+    @override_settings(CONCURRENCY_LIMIT_PER_CLIENT=1)
+    def test_streaming_response_holds_slot(self):
+        """Test the slot of a streamed response is given back on close"""
+        def view(request):
+            throttling.limiter.acquire('user:1', 1)
+            request.concurrency_client = 'user:1'
+            return StreamingHttpResponse(iter([b'[]']))
+
+        response = LoadSheddingMiddleware(view)(self.factory.get('/'))
+
+        self.assertFalse(throttling.limiter.acquire('user:1', 1))
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+        response.close()
+        self.assertTrue(throttling.limiter.acquire('user:1', 1))
@@ -0,0 +1,90 @@
+"""Tests for the expiry, usage tracking and purge of API tokens"""
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import tokens
+from core.models import TokenUsage
+
+ME_URL = reverse('user:me')
+
+
+class TokenLifecycleTests(TestCase):
+    """Test tokens expire, record their use and get purged"""
+
+    def setUp(self):
+        tokens.flush_usage()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def _age(self, token, seconds):
+        Token.objects.filter(key=token.key).update(
+            created=timezone.now() - timedelta(seconds=seconds))
+
+    @override_settings(TOKEN_TTL=3600)
+    def test_expired_token_rejected(self):
+        """Test a token older than TOKEN_TTL no longer authenticates"""
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+        self._age(self.token, 3601)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_USAGE_FLUSH_INTERVAL=3600)
+    def test_usage_buffered_then_flushed(self):
+        """Test last uses are written in one batch, keeping the latest"""
+        self.client.get(ME_URL)
+        self.assertFalse(TokenUsage.objects.exists())
+
+        later = timezone.now() + timedelta(minutes=5)
+        tokens.touch(self.token.key, later)
+        tokens.touch('deleted-token-key')
+        self.assertEqual(tokens.flush_usage(), 1)
+        tokens.touch(self.token.key, later - timedelta(minutes=1))
+        tokens.flush_usage()
+
+        usage = TokenUsage.objects.get()
+        self.assertEqual(usage.token_id, self.token.key)
+        self.assertEqual(usage.last_used_at, later)
+
+    @override_settings(TOKEN_USAGE_FLUSH_INTERVAL=0)
+    def test_usage_flushed_when_due(self):
+        """Test a request flushes the buffer once the interval passed"""
+        self.client.get(ME_URL)
+
+        self.assertTrue(TokenUsage.objects.filter(
+            token_id=self.token.key).exists())
+
+    @override_settings(TOKEN_TTL=3600)
+    def test_purge_expired_tokens(self):
+        """Test expired tokens and their usage are deleted in chunks"""
+        expired = []
+        for i in range(3):
+            user = get_user_model().objects.create_user(
+                email=f'old{i}@example.com', password='test123')
+            token = Token.objects.create(user=user)
+            TokenUsage.objects.create(token=token,
+                                      last_used_at=timezone.now())
+            self._age(token, 7200)
+            expired.append(token.key)
+
+        call_command('purge_tokens', '--chunk-size', '2', '--pause', '0',
+                     stdout=StringIO())
+
+        self.assertEqual(list(Token.objects.values_list('key', flat=True)),
+                         [self.token.key])
+        self.assertFalse(TokenUsage.objects.filter(
+            token_id__in=expired).exists())
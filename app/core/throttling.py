@@ -0,0 +1,257 @@
+"""
+Rate limiting and load shedding
+
+The DRF throttles below are token buckets: a client may burst up to the
+number of requests of its rate, then gets one more request per period
+divided by that number. Buckets are kept in the 'throttle' cache, local
+memory of the worker, and updated under a lock of that worker: the rates
+hold per process, a client spreading requests over N workers gets N times
+them.
+
+ConcurrencyThrottle caps the expensive requests a client runs at the same
+time, the slot being held until the response is closed so a streamed body
+counts until its last chunk. LoadSheddingMiddleware protects the workers
+themselves: it answers 503 when requests have been waiting longer than
+LOAD_SHED_QUEUE_TIME in the front proxy for a whole LOAD_SHED_INTERVAL,
+which means the workers are falling behind and more work would only make
+every request slower.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle, SimpleRateThrottle
+
+from core import metrics
+
+_bucket_lock = threading.Lock()
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket holding as many requests as the rate allows per period"""
+    cache = caches['throttle']
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        refill = self.num_requests / self.duration
+        now = self.timer()
+        with _bucket_lock:
+            tokens, updated = self.cache.get(
+                self.key, (self.num_requests, now))
+            tokens = min(self.num_requests,
+                         tokens + (now - updated) * refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.cache.set(self.key, (tokens, now), self.duration)
+        self.tokens = tokens
+        if not allowed:
+            metrics.inc('http_rejected_requests_total',
+                        view=getattr(request, 'metrics_view', 'unmatched'),
+                        reason=self.scope)
+        return allowed
+
+    def wait(self):
+        """Seconds until the bucket holds a whole token again"""
+        refill = self.num_requests / self.duration
+        return max(0.0, (1 - self.tokens) / refill)
+
+
+class AnonBucketThrottle(TokenBucketThrottle):
+    """Limit anonymous requests by IP address"""
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope,
+                                    'ident': self.get_ident(request)}
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    """Limit authenticated requests by user"""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope,
+                                    'ident': request.user.pk}
+
+
+class LoginBucketThrottle(TokenBucketThrottle):
+    """Limit the password checks made for one email address"""
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') \
+            else None
+        if not isinstance(email, str) or not email:
+            return None
+        ident = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class ConcurrencyLimiter:
+    """Count the requests each client is running"""
+
+    def __init__(self):
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, client, limit):
+        """Take a slot for the client, False when it has none left"""
+        with self._lock:
+            running = self._running.get(client, 0)
+            if running >= limit:
+                return False
+            self._running[client] = running + 1
+            return True
+
+    def release(self, client):
+        """Give back a slot taken by acquire"""
+        with self._lock:
+            running = self._running.pop(client) - 1
+            if running:
+                self._running[client] = running
+
+
+limiter = ConcurrencyLimiter()
+
+
+class ConcurrencyThrottle(BaseThrottle):
+    """Limit the CONCURRENCY_LIMITED_VIEWS requests a client runs at once
+
+    The client is the authenticated user, or the address of an anonymous
+    one. LoadSheddingMiddleware gives the slot back.
+    """
+
+    def allow_request(self, request, view):
+        method = request.method.lower()
+        label = f'{type(view).__name__}.' \
+            f'{getattr(view, "action", None) or method}'
+        if label not in settings.CONCURRENCY_LIMITED_VIEWS or \
+                getattr(request, 'concurrency_client', None) is not None:
+            return True
+        if request.user and request.user.is_authenticated:
+            client = f'user:{request.user.pk}'
+        else:
+            client = f'addr:{request.META.get("REMOTE_ADDR", "")}'
+        if not limiter.acquire(client,
+                               settings.CONCURRENCY_LIMIT_PER_CLIENT):
+            metrics.inc('http_rejected_requests_total', view=label,
+                        reason='concurrency')
+            return False
+        request._request.concurrency_client = client
+        return True
+
+    def wait(self):
+        return 1
+
+
+class _ReleasingStream:
+    """Streaming content giving back the slot of the client on close"""
+
+    def __init__(self, content, client):
+        self._content = content
+        self._client = client
+
+    def __iter__(self):
+        return iter(self._content)
+
+    def close(self):
+        client, self._client = self._client, None
+        if client is not None:
+            limiter.release(client)
+
+
+class QueueTimeShedder:
+    """Detect a standing queue from the time requests waited upstream
+
+    A burst may wait longer than the target for a moment, shedding only
+    starts once no request came in under the target for a whole interval.
+    """
+
+    def __init__(self, target, interval):
+        self.target = target
+        self.interval = interval
+        self._above_since = None
+        self._lock = threading.Lock()
+
+    def should_shed(self, queue_time, now):
+        """Record the queue time of a request, tell if it must be shed"""
+        with self._lock:
+            if queue_time < self.target:
+                self._above_since = None
+                return False
+            if self._above_since is None:
+                self._above_since = now
+            return now - self._above_since >= self.interval
+
+
+def queue_time(request, now):
+    """Seconds the request waited before reaching Django, or None
+
+    Reads X-Request-Start as set by nginx (t=seconds.millis) or by other
+    proxies in milliseconds or microseconds since the epoch.
+    """
+    header = request.META.get('HTTP_X_REQUEST_START', '')
+    try:
+        started = float(header.strip().lstrip('t='))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, now - started)
+
+
+def _unavailable(status, detail, retry_after):
+    response = JsonResponse({'detail': detail}, status=status)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+class LoadSheddingMiddleware:
+    """Reject requests the workers cannot serve in time"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.shedder = QueueTimeShedder(settings.LOAD_SHED_QUEUE_TIME,
+                                        settings.LOAD_SHED_INTERVAL)
+
+    def __call__(self, request):
+        now = time.time()
+        waited = queue_time(request, now)
+        if waited is not None and self.shedder.should_shed(waited, now):
+            metrics.inc('http_rejected_requests_total', view='unmatched',
+                        reason='overload')
+            return _unavailable(503, 'Server overloaded, retry later.',
+                                settings.LOAD_SHED_INTERVAL)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._release(request)
+            raise
+        client = getattr(request, 'concurrency_client', None)
+        if client is not None and response.streaming:
+            # the body is produced while it is sent, hold the slot until then
+            response.streaming_content = _ReleasingStream(
+                response.streaming_content, client)
+        else:
+            self._release(request)
+        return response
+
+    def _release(self, request):
+        client = getattr(request, 'concurrency_client', None)
+        if client is not None:
+            limiter.release(client)
@@ -0,0 +1,115 @@
+"""
+Lifecycle of the API tokens
+
+Tokens expire TOKEN_TTL seconds after they are created and logging in
+replaces the token of the user with a new one. The last use of each token
+is kept in memory and written in one statement every
+TOKEN_USAGE_FLUSH_INTERVAL seconds, instead of an UPDATE per request; a
+worker that stops loses at most that much of it.
+Expired tokens are deleted in chunks by manage.py purge_tokens.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.models import TokenUsage
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+PAUSE = 0.05
+# flush earlier when this many tokens are waiting
+MAX_PENDING = 1000
+
+_lock = threading.Lock()
+_pending = {}
+_last_flush = time.monotonic()
+
+
+def expires_at(token):
+    """Return when the token stops being accepted"""
+    return token.created + timedelta(seconds=settings.TOKEN_TTL)
+
+
+def is_expired(token, now=None):
+    """Tell whether the token is too old to authenticate"""
+    return expires_at(token) <= (now or timezone.now())
+
+
+def rotate(user):
+    """Replace the tokens of the user with a new one"""
+    with transaction.atomic():
+        Token.objects.filter(user=user).delete()
+        return Token.objects.create(user=user)
+
+
+def touch(key, now=None):
+    """Record a use of the token, flushing the buffer when it is due"""
+    global _last_flush
+    with _lock:
+        _pending[key] = now or timezone.now()
+        due = len(_pending) >= MAX_PENDING or \
+            time.monotonic() - _last_flush >= \
+            settings.TOKEN_USAGE_FLUSH_INTERVAL
+        if due:
+            _last_flush = time.monotonic()
+    if due:
+        flush_usage()
+
+
+def flush_usage():
+    """Write the buffered last uses, returns the number of rows written"""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return 0
+    table = connection.ops.quote_name(TokenUsage._meta.db_table)
+    tokens = connection.ops.quote_name(Token._meta.db_table)
+    keys, used = zip(*pending.items())
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (token_id, last_used_at) '
+                f'SELECT u.key, u.used FROM unnest(%s::varchar[], '
+                f'%s::timestamptz[]) AS u(key, used) '
+                f'WHERE EXISTS (SELECT 1 FROM {tokens} t '
+                f'WHERE t.key = u.key) '
+                f'ON CONFLICT (token_id) DO UPDATE SET last_used_at = '
+                f'GREATEST({table}.last_used_at, EXCLUDED.last_used_at)',
+                [list(keys), list(used)],
+            )
+            return cursor.rowcount
+    except DatabaseError:
+        logger.exception('Could not record the use of %s tokens',
+                         len(pending))
+        return 0
+
+
+def purge_expired(chunk_size=CHUNK_SIZE, pause=PAUSE):
+    """Delete the expired tokens and their usage, chunk by chunk"""
+    cutoff = timezone.now() - timedelta(seconds=settings.TOKEN_TTL)
+    table = connection.ops.quote_name(Token._meta.db_table)
+    usage = connection.ops.quote_name(TokenUsage._meta.db_table)
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE key IN (SELECT key FROM {table} '
+                f'WHERE created < %s LIMIT %s) RETURNING key',
+                [cutoff, chunk_size],
+            )
+            keys = [row[0] for row in cursor.fetchall()]
+            if keys:
+                cursor.execute(
+                    f'DELETE FROM {usage} WHERE token_id = ANY(%s)', [keys])
+        deleted += len(keys)
+        if len(keys) < chunk_size:
+            return deleted
+        time.sleep(pause)
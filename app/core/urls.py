@@ -0,0 +1,14 @@
+"""Urls mapping for the core endpoints"""
+from django.urls import (
+    path,
+    include
+)
+from core import views
+from rest_framework.routers import DefaultRouter
+
+router = DefaultRouter()
+router.register('jobs', views.JobViewSet)
+app_name = 'core'
+urlpatterns = [
+    path('', include(router.urls)),
+]
@@ -0,0 +1,95 @@
+"""Views that belong to the core app"""
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+)
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from rest_framework import viewsets
+from rest_framework.permissions import IsAuthenticated
+
+from core import compression, metrics
+from core.authentication import ExpiringTokenAuthentication
+from core.models import Job
+from core.serializers import JobSerializer
+from core.storage import EXTENSIONS
+
+# hashed static files never change, files keeping their name might
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+STATIC_MAX_AGE = 60
+
+
+def metrics_view(request):
+    """Expose the collected metrics for Prometheus to scrape"""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS \
+            and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def serve_static(request, path):
+    """Serve a collected static file, precompressed when accepted"""
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    if not os.path.isfile(fullpath):
+        raise Http404('Not found')
+
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+
+    siblings = [encoding for encoding in compression.available_encodings()
+                if os.path.isfile(f'{fullpath}.{EXTENSIONS[encoding]}')]
+    encoding = compression.choose_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING'), siblings) \
+        if siblings else None
+    filename = f'{fullpath}.{EXTENSIONS[encoding]}' if encoding else fullpath
+    content_type, _ = mimetypes.guess_type(fullpath)
+    response = FileResponse(
+        open(filename, 'rb'),
+        filename=os.path.basename(fullpath),
+        content_type=content_type or 'application/octet-stream',
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    # files without a compressed sibling are not worth compressing either
+    response.compression_exempt = True
+    if siblings:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    is_hashed = getattr(staticfiles_storage, 'is_hashed', None)
+    if is_hashed is not None and is_hashed(path):
+        response['Cache-Control'] = \
+            f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}'
+    return response
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status of the background jobs of the user"""
+    serializer_class = JobSerializer
+    queryset = Job.objects.all()
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """Only the jobs of the authenticated user, newest first"""
+        return self.queryset.filter(user=self.request.user).order_by('-id')
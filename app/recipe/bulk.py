@@ -0,0 +1,260 @@
+"""
+Set based writes for many recipes at once
+
+Tags and ingredients of a whole batch are resolved with one select and one
+insert per model, and the M2M links are written with one insert per relation,
+so the number of queries does not grow with the batch size. A tag or an
+ingredient is attached to or detached from a selection of recipes with a
+single statement on the through table.
+"""
+from django.db import connection
+from django.db.models import F, FileField
+from django.db.models.signals import m2m_changed
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+from core.models import Recipe, Tag, Ingredient
+from recipe import index
+
+RELATIONS = {
+    'tags': Tag,
+    'ingredients': Ingredient,
+}
+
+
+def resolve_names(model, user, names):
+    """Return {name: id} for the names, creating the missing objects"""
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(model.objects.filter(user=user, name__in=names)
+               .values_list('name', 'id'))
+    missing = [model(user=user, name=name)
+               for name in sorted(names) if name not in ids]
+    for obj in model.objects.bulk_create(missing):
+        ids[obj.name] = obj.id
+    return ids
+
+
+def _resolve_relations(user, items):
+    """Resolve the tag and ingredient names used anywhere in the items"""
+    return {
+        field: resolve_names(model, user, [
+            attr['name'] for data in items for attr in data.get(field, [])
+        ])
+        for field, model in RELATIONS.items()
+    }
+
+
+def _link(field, links):
+    """Insert (recipe id, related id) pairs into the through table"""
+    through = getattr(Recipe, field).through
+    column = f'{RELATIONS[field]._meta.model_name}_id'
+    through.objects.bulk_create(
+        [through(recipe_id=recipe_id, **{column: related_id})
+         for recipe_id, related_id in links],
+        ignore_conflicts=True,
+    )
+
+
+def _links_for(field, pairs, ids):
+    """Build the through rows of (recipe, validated data) pairs"""
+    return [
+        (recipe.id, ids[field][attr['name']])
+        for recipe, data in pairs if field in data
+        for attr in data[field]
+    ]
+
+
+def bulk_create_recipes(user, items):
+    """Create recipes from validated data and return them"""
+    ids = _resolve_relations(user, items)
+    recipes = Recipe.objects.bulk_create([
+        Recipe(user=user, **{k: v for k, v in data.items()
+                             if k not in RELATIONS})
+        for data in items
+    ])
+    pairs = list(zip(recipes, items))
+    for field in RELATIONS:
+        _link(field, _links_for(field, pairs, ids))
+    index.invalidate(user.id)
+    return recipes
+
+
+def bulk_update_recipes(user, updates):
+    """Apply (recipe, validated data) partial updates"""
+    ids = _resolve_relations(user, [data for _, data in updates])
+    fields = {'updated_at', 'version'}
+    now = timezone.now()
+    for recipe, data in updates:
+        recipe.updated_at = now
+        recipe.version = F('version') + 1
+        for attr, value in data.items():
+            if attr not in RELATIONS:
+                setattr(recipe, attr, value)
+                fields.add(attr)
+    Recipe.objects.bulk_update([recipe for recipe, _ in updates],
+                               sorted(fields))
+    for field in RELATIONS:
+        replaced = [recipe.id for recipe, data in updates if field in data]
+        if replaced:
+            getattr(Recipe, field).through.objects \
+                .filter(recipe_id__in=replaced).delete()
+            _link(field, _links_for(field, updates, ids))
+    index.invalidate(user.id)
+    return [recipe for recipe, _ in updates]
+
+
+def update_recipe(user, recipe, data, versions=None):
+    """Apply a validated update with one conditional UPDATE of the row
+
+    With versions the row is only written while its version is one of them.
+    Returns the new version, or None when the row has moved on.
+    """
+    fields, stored = {}, []
+    for attr, value in data.items():
+        if attr in RELATIONS:
+            continue
+        setattr(recipe, attr, value)
+        field = Recipe._meta.get_field(attr)
+        upload = getattr(recipe, attr) \
+            if isinstance(field, FileField) else None
+        if upload and not upload._committed:
+            stored.append(upload)
+        # let file fields store the upload and give their new name
+        fields[attr] = field.pre_save(recipe, False)
+    recipes = Recipe.objects.filter(pk=recipe.pk, user=user)
+    if versions is not None:
+        recipes = recipes.filter(version__in=versions)
+    now = timezone.now()
+    version = _update_returning_version(
+        recipes, updated_at=now, version=F('version') + 1, **fields)
+    if version is None:
+        # the row keeps its file, drop the uploads stored for nothing
+        for upload in stored:
+            upload.storage.delete(upload.name)
+        return None
+    ids = _resolve_relations(user, [data])
+    for field in RELATIONS:
+        if field in data:
+            getattr(Recipe, field).through.objects \
+                .filter(recipe_id=recipe.pk).delete()
+            _link(field, _links_for(field, [(recipe, data)], ids))
+    index.invalidate(user.id)
+    recipe.updated_at = now
+    recipe.version = version
+    return version
+
+
+def _update_returning_version(recipes, **values):
+    """UPDATE the selected row, return its new version or None"""
+    query = recipes.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    compiler = query.get_compiler(recipes.db)
+    compiler.pre_sql_setup()
+    sql, params = compiler.as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{sql} RETURNING {connection.ops.quote_name("version")}',
+            params)
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def bulk_delete_recipes(user, recipe_ids):
+    """Delete the recipes of the user and return the deleted IDs"""
+    recipes = Recipe.objects.filter(user=user, id__in=recipe_ids)
+    deleted = list(recipes.values_list('id', flat=True))
+    recipes.delete()
+    return deleted
+
+
+def select_recipes(user, recipe_ids=None, filters=None):
+    """Return the recipes of the user matching the IDs or the filters"""
+    recipes = Recipe.objects.filter(user=user)
+    if recipe_ids is not None:
+        return recipes.filter(id__in=recipe_ids)
+    if 'title' in filters:
+        recipes = recipes.filter(title__icontains=filters['title'])
+    for field in RELATIONS:
+        if field in filters:
+            recipes = recipes.filter(**{f'{field}__id__in': filters[field]})
+    return recipes.distinct()
+
+
+def _through_sql(field):
+    """Return the quoted through table and its two columns"""
+    through = getattr(Recipe, field).through
+    quote = connection.ops.quote_name
+    column = f'{RELATIONS[field]._meta.model_name}_id'
+    return (quote(through._meta.db_table), quote('recipe_id'), quote(column))
+
+
+def _notify(field, obj, action, recipe_ids):
+    """Send post_add or post_remove as a reverse relation change would"""
+    if recipe_ids:
+        m2m_changed.send(
+            sender=getattr(Recipe, field).through, instance=obj,
+            action=f'post_{action}', reverse=True, model=Recipe,
+            pk_set=set(recipe_ids), using=connection.alias,
+        )
+
+
+def attach(field, obj, recipes):
+    """Link obj to every selected recipe with one INSERT ... SELECT"""
+    table, recipe_column, column = _through_sql(field)
+    sql, params = recipes.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({recipe_column}, {column}) '
+            f'SELECT selected.id, %s FROM ({sql}) AS selected '
+            f'ON CONFLICT DO NOTHING RETURNING {recipe_column}',
+            (obj.id, *params),
+        )
+        recipe_ids = [row[0] for row in cursor.fetchall()]
+    _notify(field, obj, 'add', recipe_ids)
+    return recipe_ids
+
+
+def detach(field, obj, recipes):
+    """Unlink obj from every selected recipe with one DELETE"""
+    table, recipe_column, column = _through_sql(field)
+    sql, params = recipes.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {column} = %s '
+            f'AND {recipe_column} IN ({sql}) RETURNING {recipe_column}',
+            (obj.id, *params),
+        )
+        recipe_ids = [row[0] for row in cursor.fetchall()]
+    _notify(field, obj, 'remove', recipe_ids)
+    return recipe_ids
+
+
+def clone_recipe(recipe, count=1, **overrides):
+    """Copy the recipe row, its M2M links and its image reference
+
+    The copies are inserted at once and each relation is copied with one
+    INSERT ... SELECT, whatever the number of copies or links. A copy is
+    a new recipe, so it starts at the first version.
+    """
+    values = {
+        field.attname: field.get_prep_value(field.value_from_object(recipe))
+        for field in Recipe._meta.concrete_fields
+        if not field.primary_key and field.name != 'version'
+    }
+    values.update(overrides)
+    copies = Recipe.objects.bulk_create(
+        [Recipe(**values) for _ in range(count)])
+    copy_ids = [copy.id for copy in copies]
+    for field in RELATIONS:
+        table, recipe_column, column = _through_sql(field)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({recipe_column}, {column}) '
+                f'SELECT copy.id, link.{column} FROM {table} AS link '
+                f'CROSS JOIN unnest(%s::bigint[]) AS copy(id) '
+                f'WHERE link.{recipe_column} = %s',
+                (copy_ids, recipe.id),
+            )
+    index.invalidate(recipe.user_id)
+    return copies
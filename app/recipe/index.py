@@ -0,0 +1,305 @@
+"""
+In process index of the tags and ingredients of each user's recipes
+
+For every user the index keeps, per relation, the set of related IDs of each
+recipe and an inverted index from related ID to a sorted array of recipe IDs,
+plus the recipes grouped by number of ingredients for pantry matching.
+It is built with one query per relation the first time a user needs it, kept
+up to date by the m2m_changed and delete signals of this process, applied
+once their transaction commits, and rebuilt
+after RECIPE_INDEX_TTL seconds so changes made by other workers show up.
+
+Each index has its own lock, held while it is scored or updated, and is built
+without any lock held then swapped in, so one user never waits for another.
+Only the RECIPE_INDEX_MAX_USERS most recently used indexes are kept.
+"""
+import bisect
+import heapq
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from core.models import Recipe, Tag, Ingredient
+
+RELATIONS = {
+    'tags': Tag,
+    'ingredients': Ingredient,
+}
+WEIGHTS = {
+    'ingredients': 0.7,
+    'tags': 0.3,
+}
+
+# user ID -> index, least recently used first
+_indexes = OrderedDict()
+# user ID -> whether the user changed while its index was being built
+_building = {}
+_lock = threading.Lock()
+
+
+class UserRecipeIndex:
+    """Forward and inverted index of the recipes of one user"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.built_at = time.monotonic()
+        self.recipe_ids = set()
+        self.forward = {field: {} for field in RELATIONS}
+        self.inverted = {field: {} for field in RELATIONS}
+        # number of ingredients -> recipe IDs, recipes without any left out
+        self.by_size = {}
+        self.lock = threading.Lock()
+
+    def _resize(self, recipe_id, old, new):
+        """Move a recipe to the group of its new number of ingredients"""
+        if old:
+            self.by_size[old].discard(recipe_id)
+        if new:
+            self.by_size.setdefault(new, set()).add(recipe_id)
+
+    @classmethod
+    def build(cls, user_id):
+        """Load the index of the user from the through tables"""
+        index = cls(user_id)
+        index.recipe_ids.update(Recipe.objects.filter(user_id=user_id)
+                                .values_list('id', flat=True))
+        for field, model in RELATIONS.items():
+            column = f'{model._meta.model_name}_id'
+            links = getattr(Recipe, field).through.objects \
+                .filter(recipe__user_id=user_id) \
+                .order_by(column, 'recipe_id') \
+                .values_list('recipe_id', column)
+            forward = index.forward[field]
+            inverted = index.inverted[field]
+            for recipe_id, related_id in links.iterator():
+                forward.setdefault(recipe_id, set()).add(related_id)
+                inverted.setdefault(related_id, array('q')).append(recipe_id)
+        for recipe_id, ingredient_ids in index.forward['ingredients'].items():
+            index._resize(recipe_id, 0, len(ingredient_ids))
+        return index
+
+    def add(self, field, recipe_id, related_ids):
+        """Record links between a recipe and related objects"""
+        self.recipe_ids.add(recipe_id)
+        linked = self.forward[field].setdefault(recipe_id, set())
+        size = len(linked)
+        for related_id in set(related_ids) - linked:
+            linked.add(related_id)
+            postings = self.inverted[field].setdefault(related_id,
+                                                       array('q'))
+            bisect.insort(postings, recipe_id)
+        if field == 'ingredients':
+            self._resize(recipe_id, size, len(linked))
+
+    def remove(self, field, recipe_id, related_ids):
+        """Forget links between a recipe and related objects"""
+        linked = self.forward[field].get(recipe_id, set())
+        size = len(linked)
+        for related_id in set(related_ids) & linked:
+            linked.discard(related_id)
+            postings = self.inverted[field][related_id]
+            del postings[bisect.bisect_left(postings, recipe_id)]
+        if field == 'ingredients':
+            self._resize(recipe_id, size, len(linked))
+
+    def remove_recipe(self, recipe_id):
+        """Forget a deleted recipe"""
+        self.recipe_ids.discard(recipe_id)
+        for field in RELATIONS:
+            self.remove(field, recipe_id,
+                        list(self.forward[field].get(recipe_id, ())))
+            self.forward[field].pop(recipe_id, None)
+
+    def remove_related(self, field, related_id):
+        """Forget a deleted tag or ingredient"""
+        for recipe_id in list(self.inverted[field].get(related_id, ())):
+            self.remove(field, recipe_id, [related_id])
+        self.inverted[field].pop(related_id, None)
+
+    def similar(self, recipe_id, k, weights, metric='jaccard'):
+        """Return the k (score, recipe id) pairs most like the recipe
+
+        Candidates are found through the inverted index: the postings of
+        every tag and ingredient of the recipe are counted at C speed by
+        Counter, which gives the intersection sizes without comparing
+        recipes pairwise.
+        """
+        scores = Counter()
+        for field, weight in weights.items():
+            linked = self.forward[field].get(recipe_id, set())
+            if not linked:
+                continue
+            overlap = Counter()
+            for related_id in linked:
+                overlap.update(self.inverted[field].get(related_id, ()))
+            overlap.pop(recipe_id, None)
+            forward = self.forward[field]
+            for candidate, shared in overlap.items():
+                if metric == 'jaccard':
+                    union = len(linked) + len(forward[candidate]) - shared
+                    scores[candidate] += weight * shared / union
+                else:
+                    scores[candidate] += weight * shared
+        ranked = sorted(scores.items(),
+                        key=lambda item: (-item[1], -item[0]))
+        return [(round(score, 6), candidate)
+                for candidate, score in ranked[:k]]
+
+    def pantry(self, ingredient_ids, max_missing, limit):
+        """Return (recipe id, missing ingredient IDs, coverage) matches
+
+        Only the postings of the ingredients on hand are read, counted at C
+        speed by Counter: a recipe misses its number of ingredients minus
+        its count. Recipes using none of them match when they have at most
+        max_missing ingredients, and those are listed by by_size.
+        """
+        on_hand = set(ingredient_ids)
+        shared = Counter()
+        for ingredient_id in on_hand:
+            shared.update(self.inverted['ingredients'].get(ingredient_id, ()))
+        forward = self.forward['ingredients']
+        matches = []
+        for recipe_id, count in shared.items():
+            size = len(forward[recipe_id])
+            if size - count <= max_missing:
+                coverage = count / size
+                matches.append((size - count, -coverage, -recipe_id,
+                                coverage))
+        for size in range(1, max_missing + 1):
+            if sum(1 for match in matches if match[0] < size) >= limit:
+                break
+            # ties on missing and coverage go to the newest recipes
+            unused = self.by_size.get(size, set()).difference(shared)
+            matches.extend((size, 0.0, -recipe_id, 0.0)
+                           for recipe_id in heapq.nlargest(limit, unused))
+        return [
+            (-negated_id, sorted(forward[-negated_id] - on_hand),
+             round(coverage, 6))
+            for _, _, negated_id, coverage in heapq.nsmallest(limit, matches)
+        ]
+
+
+def get_index(user_id):
+    """Return the index of the user, building it when missing or stale"""
+    ttl = getattr(settings, 'RECIPE_INDEX_TTL', 60)
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None and time.monotonic() - index.built_at <= ttl:
+            _indexes.move_to_end(user_id)
+            return index
+        _building[user_id] = False
+    index = UserRecipeIndex.build(user_id)
+    with _lock:
+        # a change seen during the build may be missing from it, so keep the
+        # index for this call only and build again next time
+        if not _building.pop(user_id, True):
+            _indexes[user_id] = index
+            _indexes.move_to_end(user_id)
+            while len(_indexes) > settings.RECIPE_INDEX_MAX_USERS:
+                _indexes.popitem(last=False)
+    return index
+
+
+def similar_recipes(user_id, recipe_id, k, metric='jaccard'):
+    """Rank the recipes of the user by similarity to one of them"""
+    index = get_index(user_id)
+    with index.lock:
+        return index.similar(recipe_id, k, WEIGHTS, metric)
+
+
+def pantry_matches(user_id, ingredient_ids, max_missing=2, limit=50):
+    """Rank the recipes of the user by the ingredients on hand"""
+    index = get_index(user_id)
+    with index.lock:
+        return index.pantry(ingredient_ids, max_missing, limit)
+
+
+def invalidate(user_id):
+    """Drop the index of the user after a write bypassing the signals"""
+    _after_commit(user_id)
+
+
+def _after_commit(user_id, change=None):
+    """Apply a change to the loaded index of the user once committed
+
+    Without a change the index is dropped, to be built again. Nothing is
+    applied when the transaction rolls back, and a build running meanwhile
+    is not kept since it may have read the rows from before the commit.
+    """
+    def apply():
+        with _lock:
+            if user_id in _building:
+                _building[user_id] = True
+            if change is None:
+                _indexes.pop(user_id, None)
+                return
+            index = _indexes.get(user_id)
+        if index is not None:
+            with index.lock:
+                change(index)
+    transaction.on_commit(apply)
+
+
+def _m2m_changed(field, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    pk = instance.pk
+    pk_set = set(pk_set or ())
+
+    def change(index):
+        if action == 'post_clear' and reverse:
+            index.remove_related(field, pk)
+        elif action == 'post_clear':
+            index.remove(field, pk, list(index.forward[field].get(pk, ())))
+        elif reverse:
+            update = index.add if action == 'post_add' else index.remove
+            for recipe_id in pk_set:
+                update(field, recipe_id, [pk])
+        elif action == 'post_add':
+            index.add(field, pk, pk_set)
+        else:
+            index.remove(field, pk, pk_set)
+    _after_commit(instance.user_id, change)
+
+
+def _tags_changed(sender, **kwargs):
+    _m2m_changed('tags', **kwargs)
+
+
+def _ingredients_changed(sender, **kwargs):
+    _m2m_changed('ingredients', **kwargs)
+
+
+def _recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        pk = instance.pk
+        _after_commit(instance.user_id,
+                      lambda index: index.recipe_ids.add(pk))
+
+
+def _recipe_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    _after_commit(instance.user_id, lambda index: index.remove_recipe(pk))
+
+
+def _related_deleted(sender, instance, **kwargs):
+    field = 'tags' if sender is Tag else 'ingredients'
+    pk = instance.pk
+    _after_commit(instance.user_id,
+                  lambda index: index.remove_related(field, pk))
+
+
+def connect_signals():
+    """Keep the loaded indexes in sync with the changes of this process"""
+    m2m_changed.connect(_tags_changed, sender=Recipe.tags.through)
+    m2m_changed.connect(_ingredients_changed,
+                        sender=Recipe.ingredients.through)
+    post_save.connect(_recipe_saved, sender=Recipe)
+    post_delete.connect(_recipe_deleted, sender=Recipe)
+    post_delete.connect(_related_deleted, sender=Tag)
+    post_delete.connect(_related_deleted, sender=Ingredient)
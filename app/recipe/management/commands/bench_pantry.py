@@ -0,0 +1,48 @@
+"""
+Django command to time pantry matching on a large generated library
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipe.index import UserRecipeIndex
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the pantry matching of the index"""
+    help = 'Time pantry matching on an in memory index of generated recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=50000)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Distinct ingredients in the library')
+        parser.add_argument('--per-recipe', type=int, default=12,
+                            help='Most ingredients of a recipe')
+        parser.add_argument('--on-hand', type=int, nargs='+',
+                            default=[10, 40, 300])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _populate(self, rng, options):
+        index = UserRecipeIndex(0)
+        ingredients = range(options['ingredients'])
+        for recipe_id in range(1, options['recipes'] + 1):
+            count = rng.randint(1, min(options['per_recipe'],
+                                       len(ingredients)))
+            index.add('ingredients', recipe_id,
+                      rng.sample(ingredients, count))
+        return index
+
+    def handle(self, *args, **options):
+        """Enterpoint for command"""
+        rng = random.Random(0)
+        index = self._populate(rng, options)
+        for size in options['on_hand']:
+            on_hand = rng.sample(range(options['ingredients']),
+                                 min(size, options['ingredients']))
+            best = float('inf')
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                index.pantry(on_hand, 2, 50)
+                best = min(best, time.perf_counter() - started)
+            self.stdout.write(f'{size:>5} on hand: {best * 1000:8.2f} ms')
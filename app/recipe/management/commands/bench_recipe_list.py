@@ -0,0 +1,88 @@
+"""
+Django command to compare the recipe list serializers
+"""
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import representations
+from recipe.serializers import RecipeSerializer
+
+
+class Rollback(Exception):
+    """Raised to drop the benchmark data"""
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the recipe list serialization"""
+    help = 'Time RecipeSerializer against the row based representations ' \
+           'on generated recipes, rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=3,
+                            help='Tags and ingredients per recipe')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _populate(self, count, per_recipe):
+        user = get_user_model().objects.create_user(
+            email='bench@example.com', password='bench1234')
+        tags = Tag.objects.bulk_create(
+            [Tag(user=user, name=f'tag{i}') for i in range(20)])
+        ingredients = Ingredient.objects.bulk_create(
+            [Ingredient(user=user, name=f'ingredient{i}') for i in range(50)])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=i % 120,
+                   price=Decimal(i % 10000) / 100, link='https://example.com')
+            for i in range(count)
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tags[(i + j) % len(tags)])
+            for i, recipe in enumerate(recipes) for j in range(per_recipe)
+        ])
+        Recipe.ingredients.through.objects.bulk_create([
+            Recipe.ingredients.through(
+                recipe=recipe,
+                ingredient=ingredients[(i + j) % len(ingredients)])
+            for i, recipe in enumerate(recipes) for j in range(per_recipe)
+        ])
+        return Recipe.objects.filter(user=user).order_by('-id')
+
+    def _time(self, render, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    def handle(self, *args, **options):
+        """Enterpoint for command"""
+        request = APIRequestFactory().get('/api/recipe/recipes/')
+        renderer = JSONRenderer()
+        try:
+            with transaction.atomic():
+                queryset = self._populate(options['recipes'],
+                                          options['tags'])
+                serializer = self._time(lambda: renderer.render(
+                    RecipeSerializer(
+                        queryset.prefetch_related('tags', 'ingredients'),
+                        many=True, context={'request': request}).data),
+                    options['repeat'])
+                rows = self._time(lambda: renderer.render(
+                    representations.represent(queryset, request)),
+                    options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        count = options['recipes']
+        for label, seconds in (('serializer', serializer), ('rows', rows)):
+            self.stdout.write(f'{label:>10}: {seconds * 1000:8.1f} ms, '
+                              f'{count / seconds:10.0f} recipes/s')
+        self.stdout.write(f'speedup: {serializer / rows:.1f}x')
@@ -0,0 +1,86 @@
+"""
+Read only recipe representations built from database rows
+
+The list and retrieve hot paths skip the ModelSerializer field machinery:
+recipes are read with values_list(), their tags and ingredients with one
+query per relation over the through table, and the dicts are assembled
+directly. The output is the same as RecipeSerializer and
+RecipeDetailsSerializer, which the tests check.
+"""
+from itertools import islice
+
+from core.models import Recipe
+
+FIELDS = ['id', 'title', 'time_minutes', 'price', 'link']
+DETAIL_FIELDS = FIELDS + ['description', 'image']
+RELATIONS = ['tags', 'ingredients']
+
+
+def fields(detail=False):
+    """Return the columns to pass to values_list()"""
+    return DETAIL_FIELDS if detail else FIELDS
+
+
+def related_map(field, recipe_ids):
+    """Return {recipe id: [{'id', 'name'}, ...]} for one relation by ID"""
+    through = getattr(Recipe, field).through
+    related = getattr(Recipe, field).field.related_model._meta.model_name
+    links = through.objects.filter(recipe_id__in=recipe_ids) \
+        .order_by(f'{related}_id') \
+        .values_list('recipe_id', f'{related}_id', f'{related}__name')
+    result = {}
+    for recipe_id, related_id, name in links:
+        result.setdefault(recipe_id, []).append(
+            {'id': related_id, 'name': name})
+    return result
+
+
+def represent_rows(rows, request=None, detail=False):
+    """Turn values_list(*fields(detail)) rows into recipe dicts"""
+    ids = [row[0] for row in rows]
+    related = {field: related_map(field, ids) if ids else {}
+               for field in RELATIONS}
+    tags, ingredients = related['tags'], related['ingredients']
+    if detail:
+        storage = Recipe._meta.get_field('image').storage
+    results = []
+    for row in rows:
+        recipe_id, title, time_minutes, price, link = row[:5]
+        data = {
+            'id': recipe_id,
+            'title': title,
+            'time_minutes': time_minutes,
+            'price': f'{price:f}',
+            'link': link,
+            'tags': tags.get(recipe_id, []),
+            'ingredients': ingredients.get(recipe_id, []),
+        }
+        if detail:
+            description, image = row[5:]
+            data['description'] = description
+            data['image'] = _image_url(storage, image, request)
+        results.append(data)
+    return results
+
+
+def _image_url(storage, name, request):
+    if not name:
+        return None
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def represent(queryset, request=None, detail=False):
+    """Return the representations of the recipes of the queryset"""
+    return represent_rows(list(queryset.values_list(*fields(detail))),
+                          request, detail)
+
+
+def iter_represent(queryset, request=None, detail=False, chunk_size=500):
+    """Yield the representations chunk by chunk, in constant memory"""
+    rows = queryset.values_list(*fields(detail)).iterator(chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from represent_rows(chunk, request, detail)
@@ -1,5 +1,7 @@
 """Serializers for recipe app"""
 from rest_framework import serializers
+from core import conditional
+from recipe import bulk, sync
 from core.models import Recipe, Tag, Ingredient
 
 
@@ -21,6 +23,22 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class TagUsageSerializer(TagSerializer):
+    """Serializer for tags with the number of recipes using them"""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+
+
+class IngredientUsageSerializer(IngredientSerializer):
+    """Serializer for ingredients with the number of recipes using them"""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializers for recipe"""
     tags = TagSerializer(many=True, required=False)
@@ -35,22 +53,26 @@ class RecipeSerializer(serializers.ModelSerializer):
     def _get_or_create_tags(self, tags, recipe):
         """Helper function to get or create tags as needed"""
         auth_user = self.context['request'].user
+        tag_objs = []
         for tag in tags:
             tag_obj, _ = Tag.objects.get_or_create(
                 user=auth_user,
                 **tag,
             )
-            recipe.tags.add(tag_obj)
+            tag_objs.append(tag_obj)
+        recipe.tags.add(*tag_objs)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Helper function to get or create ingredients as needed"""
         auth_user = self.context['request'].user
+        ingredient_objs = []
         for ingred in ingredients:
             ingredient, _ = Ingredient.objects.get_or_create(
                 user=auth_user,
                 **ingred
             )
-            recipe.ingredients.add(ingredient)
+            ingredient_objs.append(ingredient)
+        recipe.ingredients.add(*ingredient_objs)
 
     def create(self, validate_data):
         """Create a recipe"""
@@ -62,18 +84,16 @@ class RecipeSerializer(serializers.ModelSerializer):
         return recipe
 
     def update(self, instance, validated_data):
-        """Update recipe"""
-        tags = validated_data.pop('tags', None)
-        ingredients = validated_data.pop('ingredients', None)
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
-        if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        """Update the recipe with one conditional UPDATE
+
+        Pass versions to save() to only write at one of them, a recipe that
+        moved on raises PreconditionFailed.
+        """
+        versions = validated_data.pop('versions', None)
+        version = bulk.update_recipe(self.context['request'].user, instance,
+                                     validated_data, versions)
+        if version is None:
+            raise conditional.PreconditionFailed()
         return instance
 
 
@@ -83,6 +103,76 @@ class RecipeDetailsSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ['description', 'image']
 
 
+class RecipeCloneSerializer(serializers.Serializer):
+    """Serializer for cloning a recipe"""
+    count = serializers.IntegerField(min_value=1, max_value=50, default=1)
+    title = serializers.CharField(max_length=255, required=False)
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    """Serializer for the options of the similar recipes ranking"""
+    k = serializers.IntegerField(min_value=1, max_value=50, default=10)
+    metric = serializers.ChoiceField(choices=['jaccard', 'overlap'],
+                                     default='jaccard')
+
+
+class SimilarRecipeSerializer(serializers.Serializer):
+    """Serializer for a recipe ranked by similarity"""
+    score = serializers.FloatField()
+    recipe = RecipeSerializer()
+
+
+class PantrySerializer(serializers.Serializer):
+    """Serializer for the ingredients a user has on hand"""
+    ingredients = serializers.ListField(child=serializers.IntegerField(),
+                                        max_length=1000)
+    max_missing = serializers.IntegerField(min_value=0, max_value=10,
+                                           default=2)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=50)
+
+
+class PantryMatchSerializer(serializers.Serializer):
+    """Serializer for a recipe matched against the pantry"""
+    recipe = RecipeSerializer()
+    missing = serializers.ListField(child=serializers.IntegerField())
+    coverage = serializers.FloatField()
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Serializer for an ingredient of the shopping list"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the sync feed"""
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=100)
+
+    def validate_cursor(self, value):
+        """Decode the cursor into a feed position"""
+        try:
+            return sync.decode_cursor(value)
+        except sync.InvalidCursor:
+            raise serializers.ValidationError('Invalid cursor.')
+
+
+class ChangeSerializer(serializers.Serializer):
+    """Serializer for one entry of the sync feed"""
+    type = serializers.ChoiceField(choices=list(sync.KINDS.values()))
+    id = serializers.IntegerField()
+    deleted = serializers.BooleanField()
+    data = serializers.JSONField(allow_null=True)
+
+
+class ChangesSerializer(serializers.Serializer):
+    """Serializer for a page of the sync feed"""
+    results = ChangeSerializer(many=True)
+    cursor = serializers.CharField(allow_null=True)
+    has_more = serializers.BooleanField()
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images recipes"""
 
@@ -91,3 +181,26 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         fields = ['id', 'image']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    """Serializer for filtering the recipes of the user"""
+    title = serializers.CharField(required=False)
+    tags = serializers.ListField(child=serializers.IntegerField(),
+                                 required=False)
+    ingredients = serializers.ListField(child=serializers.IntegerField(),
+                                        required=False)
+
+
+class RecipeSelectionSerializer(serializers.Serializer):
+    """Serializer selecting recipes by IDs or by a filter"""
+    recipes = serializers.ListField(child=serializers.IntegerField(),
+                                    required=False)
+    filter = RecipeFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        """Exactly one way of selecting recipes must be given"""
+        if ('recipes' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError(
+                'Provide either recipes or filter.')
+        return attrs
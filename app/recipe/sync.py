@@ -0,0 +1,155 @@
+"""
+Delta sync feed of the recipes, tags and ingredients of a user
+
+Every row carries the txid of the transaction that last wrote it, set by a
+database trigger. M2M changes write the recipe again and deletes leave a
+Tombstone. The feed is read in (txid, source, id) order from one UNION ALL
+of index range scans. The cursor handed to the client
+encodes the last position read, so a sync with nothing new costs one query.
+
+Only rows of transactions older than every transaction still running are
+handed out: a transaction committing late therefore cannot slip behind a
+cursor whatever the clocks say, and a long running write holds the feed of
+everyone back until it ends.
+"""
+import base64
+import binascii
+import heapq
+
+from django.db.models import CharField, F, IntegerField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.utils import timezone
+
+from core.models import Recipe, Tag, Ingredient, Tombstone
+
+KINDS = {
+    Recipe: 'recipe',
+    Tag: 'tag',
+    Ingredient: 'ingredient',
+}
+# position of each source in the feed order when timestamps are equal
+RANKS = {
+    'recipe': 0,
+    'tag': 1,
+    'ingredient': 2,
+    'tombstone': 3,
+}
+
+# bumped when the cursor format changes, older cursors are then refused
+CURSOR_VERSION = 2
+# transactions below this ID have all committed or rolled back
+SETTLED_TXID = 'txid_snapshot_xmin(txid_current_snapshot())'
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not produced by encode_cursor"""
+
+
+def encode_cursor(position):
+    """Turn a (txid, rank, id) position into an opaque string"""
+    txid, rank, row_id = position
+    raw = f'{CURSOR_VERSION}.{txid}.{rank}.{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (txid, rank, id) position of a cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        version, txid, rank, row_id = (int(part)
+                                       for part in raw.decode().split('.'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if version != CURSOR_VERSION:
+        raise InvalidCursor(cursor)
+    return txid, rank, row_id
+
+
+def _after(position, rank):
+    """Filter the rows of a source past the position in the feed order"""
+    txid, cursor_rank, row_id = position
+    if rank > cursor_rank:
+        return Q(txid__gte=txid)
+    elif rank < cursor_rank:
+        return Q(txid__gt=txid)
+    return Q(txid__gt=txid) | Q(txid=txid, id__gt=row_id)
+
+
+def _source(queryset, kind, object_id, position, limit):
+    """Return the next rows of one source as (txid, rank, id, kind, object)"""
+    rank = RANKS['tombstone' if queryset.model is Tombstone else kind]
+    queryset = queryset.filter(txid__lt=RawSQL(SETTLED_TXID, []))
+    if position is not None:
+        queryset = queryset.filter(_after(position, rank))
+    return queryset.annotate(
+        rank=Value(rank, output_field=IntegerField()),
+        source=F('kind') if kind is None else Value(
+            kind, output_field=CharField()),
+        target=F(object_id),
+    ).values_list('txid', 'rank', 'id', 'source', 'target') \
+        .order_by('txid', 'id')[:limit]
+
+
+def changes(user, position=None, limit=100):
+    """Return the (txid, rank, id, kind, object id) rows after the position
+
+    One more row than the limit is read so the caller knows whether the
+    feed has more.
+    """
+    sources = [
+        _source(model.objects.filter(user=user), kind, 'id', position,
+                limit + 1)
+        for model, kind in KINDS.items()
+    ]
+    sources.append(_source(Tombstone.objects.filter(user=user), None,
+                           'object_id', position, limit + 1))
+    rows = sources[0].union(*sources[1:], all=True)
+    return heapq.nsmallest(limit + 1, rows)
+
+
+def _bump(model, **filters):
+    # tags and ingredients are part of a recipe, so is its version
+    model.objects.filter(**filters).update(updated_at=timezone.now(),
+                                           version=F('version') + 1)
+
+
+def _m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if pk_set and action in ('post_add', 'post_remove') or \
+                action == 'post_clear':
+            _bump(Recipe, pk=instance.pk)
+    elif action == 'pre_clear':
+        _bump(Recipe, **{f'{KINDS[type(instance)]}s': instance})
+    elif pk_set and action in ('post_add', 'post_remove'):
+        _bump(Recipe, pk__in=pk_set)
+
+
+def _related_saved(sender, instance, created, **kwargs):
+    if not created:
+        _bump(Recipe, **{f'{KINDS[sender]}s': instance})
+
+
+def _related_deleting(sender, instance, **kwargs):
+    _bump(Recipe, **{f'{KINDS[sender]}s': instance})
+
+
+def _deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(user_id=instance.user_id, kind=KINDS[sender],
+                             object_id=instance.pk)
+
+
+def connect_signals():
+    """Record the changes made through the ORM for the sync feed"""
+    m2m_changed.connect(_m2m_changed, sender=Recipe.tags.through)
+    m2m_changed.connect(_m2m_changed, sender=Recipe.ingredients.through)
+    for model in (Tag, Ingredient):
+        post_save.connect(_related_saved, sender=model)
+        pre_delete.connect(_related_deleting, sender=model)
+    for model in KINDS:
+        post_delete.connect(_deleted, sender=model)
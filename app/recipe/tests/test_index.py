@@ -0,0 +1,201 @@
+"""Tests for the in process recipe index"""
+import random
+import threading
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient
+from recipe import index, bulk
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def create_recipe(user, **params):
+    """Create and return a recipe"""
+    return Recipe.objects.create(user=user, title='title', time_minutes=5,
+                                 price=Decimal('5.50'), **params)
+
+
+class RecipeIndexTests(TransactionTestCase):
+    """Test building and updating the index
+
+    The index follows committed changes only, so the writes of these tests
+    are committed rather than wrapped in a transaction rolled back after.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='user1234')
+        self.tag1 = Tag.objects.create(user=self.user, name='tag1')
+        self.tag2 = Tag.objects.create(user=self.user, name='tag2')
+
+    def _rebuilt(self):
+        return index.UserRecipeIndex.build(self.user.id)
+
+    def _assert_matches_database(self):
+        """The incrementally updated index equals a fresh one"""
+        loaded = index.get_index(self.user.id)
+        fresh = self._rebuilt()
+        self.assertEqual(loaded.recipe_ids, fresh.recipe_ids)
+        for field in index.RELATIONS:
+            self.assertEqual(
+                {k: v for k, v in loaded.forward[field].items() if v},
+                fresh.forward[field])
+            self.assertEqual(
+                {k: list(v) for k, v in loaded.inverted[field].items() if v},
+                {k: list(v) for k, v in fresh.inverted[field].items()})
+        self.assertEqual({k: v for k, v in loaded.by_size.items() if v},
+                         fresh.by_size)
+
+    def test_postings_sorted(self):
+        """Test the inverted index holds sorted recipe IDs"""
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        for recipe in reversed(recipes):
+            recipe.tags.add(self.tag1)
+        postings = self._rebuilt().inverted['tags'][self.tag1.id]
+        self.assertEqual(list(postings), sorted(r.id for r in recipes))
+
+    def test_incremental_updates(self):
+        """Test forward and reverse M2M changes update the index"""
+        index.invalidate(self.user.id)
+        recipe1 = create_recipe(self.user)
+        index.get_index(self.user.id)
+        recipe2 = create_recipe(self.user)
+        recipe1.tags.add(self.tag1, self.tag2)
+        self.tag1.recipe_set.add(recipe2)
+        self._assert_matches_database()
+        recipe1.tags.remove(self.tag2)
+        self.tag1.recipe_set.clear()
+        self._assert_matches_database()
+        recipe2.tags.set([self.tag2])
+        self.tag2.delete()
+        recipe1.delete()
+        self._assert_matches_database()
+
+    def test_bulk_assign_updates_index(self):
+        """Test set based attach and detach keep the index in sync"""
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        index.get_index(self.user.id)
+        selected = bulk.select_recipes(self.user, [r.id for r in recipes])
+        bulk.attach('tags', self.tag1, selected)
+        self._assert_matches_database()
+        bulk.detach('tags', self.tag1, selected.filter(id=recipes[0].id))
+        self._assert_matches_database()
+
+    def test_clone_invalidates_index(self):
+        """Test writes bypassing the signals drop the index"""
+        recipe = create_recipe(self.user)
+        recipe.tags.add(self.tag1)
+        index.get_index(self.user.id)
+        bulk.clone_recipe(recipe, count=2)
+        self._assert_matches_database()
+
+    def test_rolled_back_delete_ignored(self):
+        """Test changes of a transaction rolled back leave the index alone"""
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        recipe = create_recipe(self.user)
+        recipe.ingredients.add(salt)
+        index.get_index(self.user.id)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.delete(f'{BULK_URL}?atomic=1', [recipe.id, 999999],
+                            format='json')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+        self._assert_matches_database()
+        self.assertEqual(index.pantry_matches(self.user.id, [salt.id]),
+                         [(recipe.id, [], 1.0)])
+
+    @override_settings(RECIPE_INDEX_MAX_USERS=1)
+    def test_least_recently_used_dropped(self):
+        """Test only the most recently used indexes are kept"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='user1234')
+        index.get_index(self.user.id)
+        index.get_index(other.id)
+        self.assertNotIn(self.user.id, index._indexes)
+        self.assertIn(other.id, index._indexes)
+
+    def test_change_during_build_not_kept(self):
+        """Test an index built while the user changed is built again"""
+        index.invalidate(self.user.id)
+        build = index.UserRecipeIndex.build
+
+        def build_and_change(user_id):
+            built = build(user_id)
+            create_recipe(self.user).tags.add(self.tag1)
+            return built
+
+        with patch.object(index.UserRecipeIndex, 'build',
+                          side_effect=build_and_change):
+            index.get_index(self.user.id)
+        self.assertNotIn(self.user.id, index._indexes)
+        self._assert_matches_database()
+
+    def test_users_do_not_wait_for_each_other(self):
+        """Test scoring one user does not block the index of another"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='user1234')
+        index.get_index(other.id)
+        done = threading.Event()
+
+        def pantry():
+            index.pantry_matches(other.id, [])
+            done.set()
+
+        with index.get_index(self.user.id).lock:
+            thread = threading.Thread(target=pantry)
+            thread.start()
+            self.assertTrue(done.wait(5))
+        thread.join()
+
+    def test_pantry_matches(self):
+        """Test the ingredient counts follow changes and drive pantry"""
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        egg = Ingredient.objects.create(user=self.user, name='egg')
+        recipe1 = create_recipe(self.user)
+        recipe1.ingredients.add(salt)
+        index.get_index(self.user.id)
+        recipe2 = create_recipe(self.user)
+        recipe2.ingredients.add(salt, egg)
+        self._assert_matches_database()
+        self.assertEqual(
+            index.pantry_matches(self.user.id, [salt.id], max_missing=1),
+            [(recipe1.id, [], 1.0), (recipe2.id, [egg.id], 0.5)])
+        egg.recipe_set.clear()
+        recipe1.delete()
+        self._assert_matches_database()
+        self.assertEqual(
+            index.pantry_matches(self.user.id, [], max_missing=0), [])
+
+    def test_pantry_large_library(self):
+        """Test pantry over 50k recipes matches a brute force ranking"""
+        rng = random.Random(0)
+        large = index.UserRecipeIndex(0)
+        for recipe_id in range(1, 50001):
+            large.add('ingredients', recipe_id,
+                      rng.sample(range(2000), rng.randint(1, 12)))
+        on_hand = set(rng.sample(range(2000), 40))
+
+        matches = large.pantry(on_hand, 2, 50)
+
+        expected = sorted(
+            (len(ids - on_hand), -len(ids & on_hand) / len(ids), -recipe_id)
+            for recipe_id, ids in large.forward['ingredients'].items()
+            if len(ids - on_hand) <= 2)[:50]
+        self.assertEqual([recipe_id for recipe_id, _, _ in matches],
+                         [-negated_id for _, _, negated_id in expected])
+
+    def test_bench_command(self):
+        """Test the pantry benchmark runs"""
+        out = StringIO()
+        call_command('bench_pantry', recipes=200, ingredients=50,
+                     on_hand=[5], repeat=1, stdout=out)
+        self.assertIn('5 on hand', out.getvalue())
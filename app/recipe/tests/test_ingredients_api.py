@@ -4,7 +4,8 @@ from rest_framework.test import APIClient
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework import status
-from core.models import Ingredient
+from core.models import Ingredient, Recipe
+from decimal import Decimal
 from recipe.serializers import IngredientSerializer
 INGRED_URL = reverse('recipe:ingredient-list')
 
@@ -23,6 +24,12 @@ def create_detail_URL(id):
     return reverse('recipe:ingredient-detail', args=[id])
 
 
+def create_recipe(user, title='recipe'):
+    """Helper function that create and return a recipe with a user"""
+    return Recipe.objects.create(user=user, title=title, time_minutes=5,
+                                 price=Decimal('5.50'))
+
+
 class PublicIngredientTests(TestCase):
     """Tests unauthorized operations"""
     def setUp(self):
@@ -81,3 +88,30 @@ class PrivateIngrediantTests(TestCase):
         res = self.client.delete(create_detail_URL(ingred.id))
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Ingredient.objects.filter(id=ingred.id).exists())
+
+    def test_assign_and_unassign_ingredient(self):
+        """Test attaching and detaching an ingredient in bulk"""
+        ingred = create_Ingred(user=self.user)
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+        url = reverse('recipe:ingredient-assign', args=[ingred.id])
+        payload = {'recipes': [recipe1.id, recipe2.id]}
+        res = self.client.post(url, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['assigned'], 2)
+        self.assertIn(ingred, recipe1.ingredients.all())
+        url = reverse('recipe:ingredient-unassign', args=[ingred.id])
+        res = self.client.post(url, {'recipes': [recipe1.id]}, format='json')
+        self.assertEqual(res.data['unassigned'], 1)
+        self.assertEqual(list(ingred.recipe_set.all()), [recipe2])
+
+    def test_assigned_only_with_count(self):
+        """Test listing used ingredients with their recipe count"""
+        ingred = create_Ingred(user=self.user, name='salt')
+        create_Ingred(user=self.user, name='unused')
+        create_recipe(self.user).ingredients.add(ingred)
+        res = self.client.get(INGRED_URL,
+                              {'assigned_only': 1, 'recipe_count': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': ingred.id, 'name': 'salt', 'recipe_count': 1}])
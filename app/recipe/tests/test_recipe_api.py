@@ -1,12 +1,17 @@
 """Tests for recipe endpoints"""
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from core.models import Recipe, Tag, Ingredient
 from django.contrib.auth import get_user_model
 from decimal import Decimal
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import json
 import tempfile
+from unittest.mock import patch
 import os
 from PIL import Image
+from drf_spectacular.generators import SchemaGenerator
 from rest_framework import status
 from rest_framework.test import APIClient
 from recipe.serializers import (
@@ -14,6 +19,10 @@ from recipe.serializers import (
     RecipeDetailsSerializer
 )
 RECIPES_URL = reverse('recipe:recipe-list')
+BATCH_URL = reverse('recipe:recipe-batch')
+BULK_URL = reverse('recipe:recipe-bulk')
+PANTRY_URL = reverse('recipe:recipe-pantry')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
 
 
 def create_details_url(recipe_id):
@@ -21,6 +30,16 @@ def create_details_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
+def clone_url(recipe_id):
+    """Create and return the url for cloning a recipe"""
+    return reverse('recipe:recipe-clone', args=[recipe_id])
+
+
+def similar_url(recipe_id):
+    """Create and return the url for similar recipes"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
 def image_upload_url(recipe_id):
     """Create and return the url for uploading image"""
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
@@ -190,6 +209,23 @@ class PrivateRecipeTest(TestCase):
                 name=tag['name']).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_writes_once_per_relation(self):
+        """Test the tags and ingredients are each attached at once"""
+        payload = {
+            'title': 'recipeTestTitle',
+            'time_minutes': 5,
+            'price': Decimal('5.50'),
+            'tags': [{'name': f'tag{i}'} for i in range(5)],
+            'ingredients': [{'name': f'ingred{i}'} for i in range(5)],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        updates = [q for q in queries.captured_queries
+                   if q['sql'].startswith('UPDATE "core_recipe"')]
+        self.assertEqual(len(updates), 2)
+
     def test_create_existing_tag(self):
         """Test creating a recipe with an existing tags"""
         tag1 = Tag.objects.create(name='tag1', user=self.user)
@@ -331,6 +367,597 @@ class PrivateRecipeTest(TestCase):
         self.assertEqual(recipe.ingredients.count(), 0)
 
 
+class PaginationTest(TestCase):
+    """Test the opt in page number pagination of the list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+        for i in range(3):
+            create_recipe(user=self.user, title=f'Recipe {i}')
+
+    def test_list_unpaginated_without_page(self):
+        """Test the list stays a plain array unless a page is asked for"""
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data), 3)
+
+    def test_list_paginated(self):
+        """Test a page reports an exact count for a small library"""
+        res = self.client.get(RECIPES_URL, {'page': 1, 'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 3)
+        self.assertFalse(res.data['count_is_estimated'])
+        self.assertEqual([r['title'] for r in res.data['results']],
+                         ['Recipe 2', 'Recipe 1'])
+        self.assertIsNotNone(res.data['next'])
+
+    def test_list_paginated_estimated(self):
+        """Test a large library gets an estimated count"""
+        with patch('core.pagination.EstimatedCountPaginator'
+                   '.estimate_threshold', 0):
+            res = self.client.get(RECIPES_URL, {'page': 1})
+        self.assertTrue(res.data['count_is_estimated'])
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertIsNone(res.data['next'])
+
+    def test_estimated_pages_not_cut(self):
+        """Test a too low estimate does not hide the following pages"""
+        with patch('core.pagination.EstimatedCountPaginator'
+                   '.estimate_threshold', 0), \
+                patch('core.pagination.explain_count', return_value=1):
+            res = self.client.get(RECIPES_URL, {'page': 2, 'page_size': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['title'], 'Recipe 1')
+        self.assertIsNotNone(res.data['next'])
+
+    def test_schema_documents_plain_array(self):
+        """Test the schema gives the array and the page object shapes"""
+        spec = SchemaGenerator().get_schema(request=None, public=True)
+        response = spec['paths']['/api/recipe/recipes/']['get'][
+            'responses']['200']['content']['application/json']['schema']
+        ref = response['$ref'].split('/')[-1]
+
+        shapes = spec['components']['schemas'][ref]['oneOf']
+        self.assertEqual(shapes[0]['type'], 'array')
+        self.assertIn('results', shapes[1]['properties'])
+
+
+class StreamListTest(TestCase):
+    """Test streaming the recipe list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+        tag = Tag.objects.create(user=self.user, name='Café')
+        for i in range(5):
+            create_recipe(user=self.user, title=f'Recipe {i}').tags.add(tag)
+        create_recipe(user=create_user(email='other@example.com',
+                                       password='other1234'))
+
+    def test_stream_matches_list(self):
+        """Test the streamed bytes equal the regular list"""
+        expected = self.client.get(RECIPES_URL).content
+        with patch('recipe.views.RecipeViewSet.stream_chunk_size', 2):
+            res = self.client.get(RECIPES_URL, {'stream': 1})
+            self.assertTrue(res.streaming)
+            chunks = list(res.streaming_content)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(chunks[0], b'[')
+        self.assertEqual(b''.join(chunks), expected)
+        self.assertEqual(len(json.loads(expected)), 5)
+
+    def test_stream_empty(self):
+        """Test an empty list streams as an empty array"""
+        Recipe.objects.filter(user=self.user).delete()
+        res = self.client.get(RECIPES_URL, {'stream': 1})
+        self.assertEqual(b''.join(res.streaming_content), b'[]')
+
+
+class ConditionalUpdateTest(TestCase):
+    """Test updates guarded by the version in If-Match"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+        self.url = create_details_url(self.recipe.id)
+
+    def test_etag_follows_writes(self):
+        """Test reads and writes return the version as ETag"""
+        res = self.client.get(self.url)
+        self.assertEqual(res['ETag'], '"1"')
+
+        res = self.client.patch(self.url, {'title': 'New'},
+                                HTTP_IF_MATCH='"1"')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['ETag'], '"2"')
+        self.assertEqual(self.client.get(self.url)['ETag'], '"2"')
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Other', 'time_minutes': 5, 'price': '1.00'})
+        self.assertEqual(res['ETag'], '"1"')
+
+    def test_create_with_tags_then_conditional_update(self):
+        """Test the ETag of a create counts the tags and ingredients added"""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Other', 'time_minutes': 5, 'price': '1.00',
+            'tags': [{'name': 'Vegan'}, {'name': 'Quick'}],
+            'ingredients': [{'name': 'Salt'}]}, format='json')
+        url = create_details_url(res.data['id'])
+
+        self.assertEqual(res['ETag'], self.client.get(url)['ETag'])
+        res = self.client.patch(url, {'title': 'New'},
+                                HTTP_IF_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['ETag'], self.client.get(url)['ETag'])
+
+    def test_stale_write_rejected(self):
+        """Test a write at an old version is refused in one UPDATE"""
+        self.client.patch(self.url, {'title': 'First'})
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.put(self.url, {
+                'title': 'Second', 'time_minutes': 10, 'price': '2.00',
+                'tags': [{'name': 'Vegan'}]},
+                format='json', HTTP_IF_MATCH='"1"')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_412_PRECONDITION_FAILED)
+        updates = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'First')
+        self.assertEqual(self.recipe.version, 2)
+        self.assertFalse(self.recipe.tags.exists())
+
+    def test_stale_write_keeps_no_upload(self):
+        """Test an image sent at an old version is not left in storage"""
+        self.client.patch(self.url, {'title': 'First'})
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root), \
+                tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            res = self.client.patch(self.url, {'image': image_file},
+                                    format='multipart', HTTP_IF_MATCH='"1"')
+
+            self.assertEqual(res.status_code,
+                             status.HTTP_412_PRECONDITION_FAILED)
+            self.assertEqual(
+                [files for _, _, files in os.walk(media_root) if files], [])
+
+    def test_weak_and_listed_etags_match(self):
+        """Test weakened ETags and lists of ETags are understood"""
+        res = self.client.patch(self.url, {'title': 'A'},
+                                HTTP_IF_MATCH='W/"1"')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.put(self.url, {
+            'title': 'B', 'time_minutes': 10, 'price': '2.00',
+            'tags': [{'name': 'Vegan'}]},
+            format='json', HTTP_IF_MATCH='"7", "2"')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.version, 3)
+        self.assertEqual([t.name for t in self.recipe.tags.all()], ['Vegan'])
+        self.assertEqual(res.data['tags'][0]['name'], 'Vegan')
+        res = self.client.patch(self.url, {'title': 'C'},
+                                HTTP_IF_MATCH='not-an-etag')
+        self.assertEqual(res.status_code,
+                         status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_other_changes_bump_version(self):
+        """Test saves and tag changes move the version on"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        tag.name = 'Vegetarian'
+        tag.save()
+        self.recipe.refresh_from_db()
+        self.recipe.save()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.version, 4)
+
+
+class BatchRetrieveTest(TestCase):
+    """Test retrieving several recipes at once"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+
+    def test_batch_keeps_requested_order(self):
+        """Test recipes are returned in the order of the IDs"""
+        recipe1 = create_recipe(user=self.user, title='first')
+        recipe2 = create_recipe(user=self.user, title='second')
+        recipe2.tags.add(Tag.objects.create(user=self.user, name='tag'))
+        ids = f'{recipe2.id},{recipe1.id}'
+        with self.assertNumQueries(3):
+            res = self.client.get(BATCH_URL, {'ids': ids})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        serializer = RecipeDetailsSerializer([recipe2, recipe1], many=True)
+        self.assertEqual(res.data['results'], serializer.data)
+        self.assertEqual(res.data['not_found'], [])
+
+    def test_batch_reports_missing_and_foreign_ids(self):
+        """Test other users recipes and unknown IDs are not found"""
+        other_user = create_user(email='t@example.com', password='t123456')
+        recipe = create_recipe(user=self.user)
+        other_recipe = create_recipe(user=other_user)
+        ids = f'{recipe.id},{other_recipe.id},999999'
+        res = self.client.get(BATCH_URL, {'ids': ids})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+        self.assertEqual(res.data['not_found'], [other_recipe.id, 999999])
+
+    def test_batch_invalid_ids(self):
+        """Test non integer IDs are rejected"""
+        res = self.client.get(BATCH_URL, {'ids': '1,abc'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_too_many_ids(self):
+        """Test the number of IDs is limited"""
+        ids = ','.join(str(i) for i in range(1, 52))
+        res = self.client.get(BATCH_URL, {'ids': ids})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkRecipeTest(TestCase):
+    """Test bulk create, update and delete of recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+
+    def _payload(self, count):
+        return [{
+            'title': f'recipe {i}',
+            'time_minutes': 5,
+            'price': '5.50',
+            'tags': [{'name': 'vegan'}, {'name': f'tag {i % 2}'}],
+            'ingredients': [{'name': 'salt'}],
+        } for i in range(count)]
+
+    def test_bulk_create(self):
+        """Test creating recipes with shared tags and ingredients"""
+        Tag.objects.create(user=self.user, name='vegan')
+        res = self.client.post(BULK_URL, self._payload(3), format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertEqual(res.data['errors'], [])
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.ingredients.count(), 1)
+
+    def test_bulk_create_queries_independent_of_size(self):
+        """Test the number of queries does not grow with the batch"""
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(BULK_URL, self._payload(2), format='json')
+        Recipe.objects.all().delete()
+        Tag.objects.all().delete()
+        Ingredient.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(BULK_URL, self._payload(20), format='json')
+        self.assertEqual(len(small), len(large))
+
+    def test_bulk_create_reports_invalid_items(self):
+        """Test invalid items are reported and valid ones created"""
+        payload = self._payload(2)
+        payload[1]['time_minutes'] = 'abc'
+        res = self.client.post(BULK_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['errors'][0]['index'], 1)
+        self.assertIn('time_minutes', res.data['errors'][0]['errors'])
+
+    def test_bulk_create_atomic(self):
+        """Test nothing is created in atomic mode when an item fails"""
+        payload = self._payload(2)
+        del payload[0]['title']
+        res = self.client.post(f'{BULK_URL}?atomic=1', payload,
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_partial_update(self):
+        """Test updating fields and replacing tags of several recipes"""
+        other_user = create_user(email='t@example.com', password='t123456')
+        recipe1 = create_recipe(user=self.user)
+        recipe2 = create_recipe(user=self.user)
+        other_recipe = create_recipe(user=other_user)
+        recipe1.tags.add(Tag.objects.create(user=self.user, name='old'))
+        payload = [
+            {'id': recipe1.id, 'title': 'new 1', 'tags': [{'name': 'new'}]},
+            {'id': recipe2.id, 'time_minutes': 30},
+            {'id': other_recipe.id, 'title': 'hacked'},
+        ]
+        res = self.client.patch(BULK_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['errors'][0]['index'], 2)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        other_recipe.refresh_from_db()
+        self.assertEqual(recipe1.title, 'new 1')
+        self.assertEqual([t.name for t in recipe1.tags.all()], ['new'])
+        self.assertEqual(recipe2.time_minutes, 30)
+        self.assertEqual(recipe2.title, 'recipeTestTitle')
+        self.assertEqual(other_recipe.title, 'recipeTestTitle')
+
+    def test_bulk_delete(self):
+        """Test deleting several recipes"""
+        other_user = create_user(email='t@example.com', password='t123456')
+        recipe1 = create_recipe(user=self.user)
+        recipe2 = create_recipe(user=self.user)
+        other_recipe = create_recipe(user=other_user)
+        payload = [recipe1.id, recipe2.id, other_recipe.id]
+        res = self.client.delete(BULK_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(res.data['deleted']),
+                         [recipe1.id, recipe2.id])
+        self.assertEqual(res.data['not_found'], [other_recipe.id])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+        self.assertTrue(Recipe.objects.filter(id=other_recipe.id).exists())
+
+    def test_bulk_boolean_ids_rejected(self):
+        """Test JSON booleans are not taken for recipe IDs"""
+        recipe = create_recipe(user=self.user)
+        Recipe.objects.filter(id=recipe.id).update(id=1)
+
+        res = self.client.patch(BULK_URL, [{'id': True, 'title': 'hijack'}],
+                                format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.delete(BULK_URL, [True], format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.get(id=1).title, 'recipeTestTitle')
+
+    def test_bulk_delete_atomic(self):
+        """Test nothing is deleted in atomic mode when an ID is missing"""
+        recipe = create_recipe(user=self.user)
+        res = self.client.delete(f'{BULK_URL}?atomic=1', [recipe.id, 999999],
+                                 format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+
+class CloneRecipeTest(TestCase):
+    """Test cloning recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user, image='uploads/a.jpg')
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='tag'))
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='salt'))
+
+    def test_clone_recipe(self):
+        """Test the copy has the fields, links and image of the recipe"""
+        res = self.client.post(clone_url(self.recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        copy = Recipe.objects.get(id=res.data['results'][0]['id'])
+        self.assertNotEqual(copy.id, self.recipe.id)
+        for field in ('title', 'description', 'time_minutes', 'price',
+                      'link', 'user'):
+            self.assertEqual(getattr(copy, field),
+                             getattr(self.recipe, field))
+        self.assertEqual(copy.image.name, self.recipe.image.name)
+        self.assertEqual(copy.version, 1)
+        self.assertEqual(list(copy.tags.all()), list(self.recipe.tags.all()))
+        self.assertEqual(list(copy.ingredients.all()),
+                         list(self.recipe.ingredients.all()))
+
+    def test_clone_many_constant_queries(self):
+        """Test N copies take as many queries as one copy"""
+        with CaptureQueriesContext(connection) as one:
+            self.client.post(clone_url(self.recipe.id))
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.post(clone_url(self.recipe.id),
+                                   {'count': 10, 'title': 'template'})
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(len(res.data['results']), 10)
+        self.assertEqual(
+            Recipe.objects.filter(user=self.user, title='template').count(),
+            10)
+
+    def test_clone_other_users_recipe(self):
+        """Test another user's recipe can not be cloned"""
+        other_user = create_user(email='t@example.com', password='t123456')
+        recipe = create_recipe(user=other_user)
+        res = self.client.post(clone_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SimilarRecipeTest(TransactionTestCase):
+    """Test ranking similar recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+        self.salt, self.egg, self.milk, self.flour = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('salt', 'egg', 'milk', 'flour')]
+
+    def _recipe(self, *ingredients):
+        recipe = create_recipe(user=self.user)
+        recipe.ingredients.add(*ingredients)
+        return recipe
+
+    def test_similar_ranked_by_jaccard(self):
+        """Test recipes are ranked by shared ingredients"""
+        pancake = self._recipe(self.egg, self.milk, self.flour)
+        crepe = self._recipe(self.egg, self.milk, self.flour, self.salt)
+        omelette = self._recipe(self.egg, self.salt)
+        self._recipe(self.salt)
+        res = self.client.get(similar_url(pancake.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ranked = [item['recipe']['id'] for item in res.data['results']]
+        self.assertEqual(ranked, [crepe.id, omelette.id])
+        self.assertEqual(res.data['results'][0]['score'],
+                         round(0.7 * 3 / 4, 6))
+
+    def test_similar_follows_changes(self):
+        """Test the index is updated when ingredients change"""
+        pancake = self._recipe(self.egg, self.milk)
+        omelette = self._recipe(self.salt)
+        self.client.get(similar_url(pancake.id))
+        omelette.ingredients.add(self.egg)
+        res = self.client.get(similar_url(pancake.id), {'k': 1})
+        self.assertEqual(res.data['results'][0]['recipe']['id'],
+                         omelette.id)
+        omelette.delete()
+        res = self.client.get(similar_url(pancake.id))
+        self.assertEqual(res.data['results'], [])
+
+    def test_similar_other_users_recipe(self):
+        """Test similar recipes of another user's recipe are hidden"""
+        other_user = create_user(email='t@example.com', password='t123456')
+        recipe = create_recipe(user=other_user)
+        res = self.client.get(similar_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PantryTest(TransactionTestCase):
+    """Test matching recipes against the ingredients on hand"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+        self.salt, self.egg, self.milk, self.flour = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('salt', 'egg', 'milk', 'flour')]
+
+    def _recipe(self, *ingredients):
+        recipe = create_recipe(user=self.user)
+        recipe.ingredients.add(*ingredients)
+        return recipe
+
+    def test_pantry_ranks_by_missing(self):
+        """Test makeable recipes come first, then the ones missing a few"""
+        pancake = self._recipe(self.egg, self.milk, self.flour)
+        omelette = self._recipe(self.egg, self.salt)
+        boiled_egg = self._recipe(self.egg)
+        bread = self._recipe(self.salt, self.milk, self.flour)
+        payload = {'ingredients': [self.egg.id, self.salt.id],
+                   'max_missing': 2}
+        res = self.client.post(PANTRY_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = [(item['recipe']['id'], item['missing'], item['coverage'])
+                   for item in res.data['results']]
+        self.assertEqual(results, [
+            (boiled_egg.id, [], 1.0),
+            (omelette.id, [], 1.0),
+            (bread.id, sorted([self.milk.id, self.flour.id]),
+             round(1 / 3, 6)),
+            (pancake.id, sorted([self.milk.id, self.flour.id]),
+             round(1 / 3, 6)),
+        ])
+
+    def test_pantry_limits_missing(self):
+        """Test recipes missing too many ingredients are left out"""
+        self._recipe(self.egg, self.milk, self.flour)
+        payload = {'ingredients': [self.salt.id], 'max_missing': 2}
+        res = self.client.post(PANTRY_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    def test_pantry_follows_changes(self):
+        """Test the index stays consistent on create, update and delete"""
+        recipe = self._recipe(self.egg)
+        payload = {'ingredients': [self.egg.id], 'max_missing': 0}
+        self.client.post(PANTRY_URL, payload, format='json')
+        new_recipe = self._recipe(self.egg)
+        res = self.client.patch(create_details_url(recipe.id),
+                                {'ingredients': [{'name': 'milk'}]},
+                                format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.post(PANTRY_URL, payload, format='json')
+        ids = [item['recipe']['id'] for item in res.data['results']]
+        self.assertEqual(ids, [new_recipe.id])
+        self.client.delete(create_details_url(new_recipe.id))
+        res = self.client.post(PANTRY_URL, payload, format='json')
+        self.assertEqual(res.data['results'], [])
+
+
+class ShoppingListTest(TestCase):
+    """Test merging the ingredients of several recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+        self.salt, self.egg, self.milk = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('salt', 'egg', 'milk')]
+        self.recipe1 = create_recipe(user=self.user, title='Omelette')
+        self.recipe1.ingredients.add(self.egg, self.salt)
+        self.recipe2 = create_recipe(user=self.user, title='Pancake')
+        self.recipe2.ingredients.add(self.egg, self.milk)
+        self.expected = [
+            {'id': self.egg.id, 'name': 'egg', 'recipe_count': 2},
+            {'id': self.milk.id, 'name': 'milk', 'recipe_count': 1},
+            {'id': self.salt.id, 'name': 'salt', 'recipe_count': 1},
+        ]
+
+    def test_shopping_list_by_ids(self):
+        """Test the ingredients are deduplicated in one query"""
+        payload = {'recipes': [self.recipe1.id, self.recipe2.id]}
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(SHOPPING_LIST_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], self.expected)
+        self.assertEqual(len(queries), 1)
+
+    def test_shopping_list_by_filter(self):
+        """Test the recipes can be selected with a filter"""
+        payload = {'filter': {'title': 'omelette'}}
+        res = self.client.post(SHOPPING_LIST_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in res.data['results']],
+                         ['egg', 'salt'])
+
+    def test_shopping_list_other_user(self):
+        """Test recipes of other users are ignored"""
+        other = create_user(email='other@example.com', password='other1234')
+        recipe = create_recipe(user=other)
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=other, name='flour'))
+        payload = {'recipes': [recipe.id]}
+        res = self.client.post(SHOPPING_LIST_URL, payload, format='json')
+        self.assertEqual(res.data['results'], [])
+
+    def test_shopping_list_stream(self):
+        """Test the streaming mode sends one JSON line per ingredient"""
+        payload = {'recipes': [self.recipe1.id, self.recipe2.id]}
+        res = self.client.post(f'{SHOPPING_LIST_URL}?stream=1', payload,
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        content = b''.join(res.streaming_content).decode()
+        self.assertEqual([json.loads(line) for line in content.splitlines()],
+                         self.expected)
+
+    def test_shopping_list_requires_selection(self):
+        """Test a selection must be given"""
+        res = self.client.post(SHOPPING_LIST_URL, {}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class ImageUploadTest(TestCase):
     """Test for images"""
 
@@ -0,0 +1,84 @@
+"""Tests for the read only recipe representations"""
+import json
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db.models import Prefetch
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import representations
+from recipe.serializers import RecipeSerializer, RecipeDetailsSerializer
+
+
+class RepresentationTests(TestCase):
+    """Test the representations match the DRF serializers"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='user1234')
+        self.request = APIRequestFactory().get('/api/recipe/recipes/')
+        tags = [Tag.objects.create(user=self.user, name=f'tag{i}')
+                for i in range(3)]
+        salt = Ingredient.objects.create(user=self.user, name='salt')
+        prices = [Decimal('5.50'), Decimal('0.05'), Decimal('100'),
+                  Decimal('999.99')]
+        for i, price in enumerate(prices):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=i,
+                price=price, link='' if i % 2 else 'https://example.com',
+                description=f'Description {i}')
+            recipe.tags.add(*tags[:i])
+            if i % 2:
+                recipe.ingredients.add(salt)
+        self.queryset = Recipe.objects.order_by('-id')
+
+    def _render(self, data):
+        return json.loads(JSONRenderer().render(data))
+
+    def test_list_matches_serializer(self):
+        """Test the list representation is identical"""
+        expected = RecipeSerializer(
+            self.queryset.prefetch_related(
+                Prefetch('tags', Tag.objects.order_by('id')),
+                Prefetch('ingredients', Ingredient.objects.order_by('id'))),
+            many=True, context={'request': self.request}).data
+        with self.assertNumQueries(3):
+            data = representations.represent(self.queryset, self.request)
+        self.assertEqual(JSONRenderer().render(data),
+                         JSONRenderer().render(expected))
+
+    def test_detail_matches_serializer(self):
+        """Test the detail representation, image included, is identical"""
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            recipe = self.queryset.first()
+            recipe.image.save('image.jpg', ContentFile(b'jpeg'))
+            for recipe in self.queryset:
+                expected = RecipeDetailsSerializer(
+                    recipe, context={'request': self.request}).data
+                data = representations.represent(
+                    self.queryset.filter(id=recipe.id), self.request,
+                    detail=True)
+                self.assertEqual(self._render(data), [self._render(expected)])
+                self.assertEqual(list(data[0]), list(expected))
+
+    def test_empty(self):
+        """Test no query is made for the relations of no recipes"""
+        with self.assertNumQueries(1):
+            data = representations.represent(
+                self.queryset.filter(title='missing'))
+        self.assertEqual(data, [])
+
+    def test_bench_command(self):
+        """Test the benchmark runs and leaves no data behind"""
+        out = StringIO()
+        call_command('bench_recipe_list', recipes=20, repeat=2, stdout=out)
+        self.assertIn('speedup', out.getvalue())
+        self.assertEqual(Recipe.objects.count(), 4)
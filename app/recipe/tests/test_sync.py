@@ -0,0 +1,148 @@
+"""Tests for the delta sync feed"""
+import threading
+from decimal import Decimal
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient, Tombstone
+from recipe import bulk, sync
+
+CHANGES_URL = reverse('recipe:changes')
+
+
+def create_recipe(user, **params):
+    """Create and return a recipe"""
+    return Recipe.objects.create(user=user, title='title', time_minutes=5,
+                                 price=Decimal('5.50'), **params)
+
+
+class PublicChangesTest(TestCase):
+    """Test unauthenticated access to the feed"""
+
+    def test_auth_required(self):
+        """Test the feed requires authentication"""
+        res = APIClient().get(CHANGES_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ChangesTest(TransactionTestCase):
+    """Test syncing with the changes feed"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='user1234')
+        self.client.force_authenticate(self.user)
+
+    def _sync(self, cursor=None, **params):
+        if cursor is not None:
+            params['cursor'] = cursor
+        res = self.client.get(CHANGES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def _entries(self, data):
+        return [(e['type'], e['id'], e['deleted']) for e in data['results']]
+
+    def test_full_then_delta_sync(self):
+        """Test a cursor only returns what changed after it"""
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        recipe = create_recipe(self.user)
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='other1234')
+        create_recipe(other)
+        data = self._sync()
+        self.assertEqual(self._entries(data), [('tag', tag.id, False),
+                                               ('recipe', recipe.id, False)])
+        self.assertEqual(data['results'][1]['data']['title'], 'title')
+        self.assertFalse(data['has_more'])
+
+        with self.assertNumQueries(1):
+            empty = self._sync(data['cursor'])
+        self.assertEqual(empty['results'], [])
+        self.assertEqual(empty['cursor'], data['cursor'])
+
+        recipe.tags.add(tag)
+        tag_id = tag.id
+        tag.delete()
+        delta = self._sync(data['cursor'])
+        self.assertEqual(self._entries(delta),
+                         [('recipe', recipe.id, False),
+                          ('tag', tag_id, True)])
+
+    def test_m2m_changes_bump_recipe(self):
+        """Test attaching a tag to recipes marks them as changed"""
+        recipes = [create_recipe(self.user) for _ in range(2)]
+        tag = Tag.objects.create(user=self.user, name='vegan')
+        cursor = self._sync()['cursor']
+        bulk.attach('tags', tag, Recipe.objects.filter(id=recipes[0].id))
+        self.assertEqual(self._entries(self._sync(cursor)),
+                         [('recipe', recipes[0].id, False)])
+        cursor = self._sync()['cursor']
+        tag.recipe_set.clear()
+        self.assertEqual(self._entries(self._sync(cursor)),
+                         [('recipe', recipes[0].id, False)])
+
+    def test_bulk_update_and_delete(self):
+        """Test the set based writes show up in the feed"""
+        recipe = create_recipe(self.user)
+        ingredient = Ingredient.objects.create(user=self.user, name='salt')
+        cursor = self._sync()['cursor']
+        bulk.bulk_update_recipes(self.user, [(recipe, {'title': 'new'})])
+        bulk.bulk_delete_recipes(self.user, [recipe.id])
+        ingredient.name = 'pepper'
+        ingredient.save()
+        self.assertEqual(self._entries(self._sync(cursor)),
+                         [('recipe', recipe.id, True),
+                          ('ingredient', ingredient.id, False)])
+        self.assertEqual(Tombstone.objects.count(), 1)
+
+    def test_pagination(self):
+        """Test paging through the feed returns every change once"""
+        recipes = [create_recipe(self.user) for _ in range(5)]
+        # one statement, so the rows share their txid
+        Recipe.objects.update(title='same')
+        seen, cursor, has_more = [], None, True
+        while has_more:
+            data = self._sync(cursor, limit=2)
+            seen += [entry['id'] for entry in data['results']]
+            cursor, has_more = data['cursor'], data['has_more']
+        self.assertEqual(seen, [recipe.id for recipe in recipes])
+
+    def test_late_commit_not_skipped(self):
+        """Test a transaction committing after a later one is not skipped"""
+        seen = {}
+
+        def write_and_sync():
+            seen['later'] = create_recipe(self.user)
+            seen['rows'] = sync.changes(self.user)
+            connection.close()
+
+        with transaction.atomic():
+            early = create_recipe(self.user)
+            thread = threading.Thread(target=write_and_sync)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(seen['rows'], [])
+        self.assertEqual(self._entries(self._sync()),
+                         [('recipe', early.id, False),
+                          ('recipe', seen['later'].id, False)])
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor is rejected"""
+        res = self.client.get(CHANGES_URL, {'cursor': 'not a cursor'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cursor_round_trip(self):
+        """Test cursors keep the exact position"""
+        recipe = create_recipe(self.user)
+        recipe.refresh_from_db()
+        position = (recipe.txid, 0, recipe.id)
+        self.assertEqual(sync.decode_cursor(sync.encode_cursor(position)),
+                         position)
+        with self.assertRaises(sync.InvalidCursor):
+            sync.decode_cursor('MTcwMDAwMDAwMDAwMDAwMC4wLjE')
@@ -3,7 +3,8 @@ from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.urls import reverse
-from core.models import Tag
+from core.models import Tag, Recipe
+from decimal import Decimal
 from django.contrib.auth import get_user_model
 from recipe.serializers import TagSerializer
 
@@ -24,6 +25,20 @@ def create_detail_URL(tag_id):
     return reverse('recipe:tag-detail', args=[tag_id])
 
 
+def assign_URL(tag_id):
+    return reverse('recipe:tag-assign', args=[tag_id])
+
+
+def unassign_URL(tag_id):
+    return reverse('recipe:tag-unassign', args=[tag_id])
+
+
+def create_recipe(user, title='recipe'):
+    """Helper function that create and return a recipe with a user"""
+    return Recipe.objects.create(user=user, title=title, time_minutes=5,
+                                 price=Decimal('5.50'))
+
+
 class PublicTagsAPITest(TestCase):
     """Test features that do not need authentication for tags"""
     def setUp(self):
@@ -81,3 +96,81 @@ class PrivateTagsAPITest(TestCase):
         res = self.client.delete(create_detail_URL(tag.id))
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Tag.objects.filter(id=tag.id).exists())
+
+    def test_assign_tag_to_recipes(self):
+        """Test attaching a tag to recipes by IDs in one statement"""
+        tag = create_tag(user=self.user, name='vegan')
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+        recipe1.tags.add(tag)
+        other_recipe = create_recipe(create_user(email='o@example.com'))
+        payload = {'recipes': [recipe1.id, recipe2.id, other_recipe.id]}
+        res = self.client.post(assign_URL(tag.id), payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['assigned'], 1)
+        self.assertIn(tag, recipe2.tags.all())
+        self.assertEqual(other_recipe.tags.count(), 0)
+
+    def test_assign_tag_by_filter(self):
+        """Test attaching a tag to the recipes matching a filter"""
+        tag = create_tag(user=self.user, name='vegan')
+        salad = create_recipe(self.user, title='Green salad')
+        create_recipe(self.user, title='Steak')
+        payload = {'filter': {'title': 'salad'}}
+        res = self.client.post(assign_URL(tag.id), payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(tag.recipe_set.all()), [salad])
+
+    def test_unassign_tag(self):
+        """Test detaching a tag from the recipes having another tag"""
+        tag = create_tag(user=self.user, name='vegan')
+        other_tag = create_tag(user=self.user, name='dinner')
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+        recipe1.tags.add(tag, other_tag)
+        recipe2.tags.add(tag)
+        payload = {'filter': {'tags': [other_tag.id]}}
+        res = self.client.post(unassign_URL(tag.id), payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['unassigned'], 1)
+        self.assertEqual(list(tag.recipe_set.all()), [recipe2])
+
+    def test_assign_needs_one_selection(self):
+        """Test the recipes must be selected by IDs or by a filter"""
+        tag = create_tag(user=self.user)
+        res = self.client.post(assign_URL(tag.id), {}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_assign_other_users_tag(self):
+        """Test another user's tag can not be assigned"""
+        tag = create_tag(user=create_user(email='o@example.com'))
+        recipe = create_recipe(self.user)
+        res = self.client.post(assign_URL(tag.id), {'recipes': [recipe.id]},
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filter_assigned_only(self):
+        """Test listing only the tags used by recipes"""
+        tag = create_tag(user=self.user, name='used')
+        create_tag(user=self.user, name='unused')
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+        recipe1.tags.add(tag)
+        recipe2.tags.add(tag)
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, TagSerializer([tag], many=True).data)
+
+    def test_recipe_count(self):
+        """Test listing tags with the number of recipes using them"""
+        tag = create_tag(user=self.user, name='used')
+        create_tag(user=self.user, name='unused')
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+        recipe1.tags.add(tag)
+        recipe2.tags.add(tag)
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, {'recipe_count': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        counts = {item['name']: item['recipe_count'] for item in res.data}
+        self.assertEqual(counts, {'used': 2, 'unused': 0})
@@ -12,5 +12,6 @@ router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
 app_name = 'recipe'
 urlpatterns = [
+    path('changes/', views.ChangesView.as_view(), name='changes'),
     path('', include(router.urls)),
 ]
@@ -1,19 +1,53 @@
 """Views for the recipe APIs"""
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from django.db import transaction
+from core.authentication import ExpiringTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from core.models import Recipe, Tag, Ingredient
-from recipe import serializers
+from recipe import serializers, bulk, sync, representations
+from recipe.index import similar_recipes, pantry_matches
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.db.models import Count, Exists, OuterRef
+from drf_spectacular.utils import (
+    extend_schema,
+    extend_schema_view,
+    OpenApiParameter,
+)
+from core import conditional, metrics
+from core.coalescing import CoalesceReadsMixin
+from core.pagination import EstimatedPageNumberPagination
+from core.profiling import ServerTimingMixin
+from core.streaming import JSONArrayResponse, JSONLinesResponse
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+def _is_id(value):
+    """Tell whether a JSON value is an ID, booleans are not"""
+    return type(value) is int
+
+
+IF_MATCH = OpenApiParameter(
+    'If-Match', str, OpenApiParameter.HEADER,
+    description='ETag of the version to change, 412 when it moved on')
+
+
+@extend_schema_view(
+    update=extend_schema(parameters=[IF_MATCH]),
+    partial_update=extend_schema(parameters=[IF_MATCH]),
+)
+class RecipeViewSet(CoalesceReadsMixin, ServerTimingMixin,
+                    viewsets.ModelViewSet):
     """View for manage recipe APIs"""
     serializer_class = serializers.RecipeDetailsSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = EstimatedPageNumberPagination
+    batch_max_ids = 50
+    bulk_max_items = 500
+    stream_chunk_size = 500
 
     def get_queryset(self):
         """Override get query set"""
@@ -25,11 +59,281 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'clone':
+            return serializers.RecipeCloneSerializer
+        elif self.action == 'pantry':
+            return serializers.PantrySerializer
+        elif self.action == 'shopping_list':
+            return serializers.RecipeSelectionSerializer
         return self.serializer_class
 
+    @extend_schema(
+        description='List the recipes of the user as an array, or a page '
+                    'of them in an object when page is sent',
+        parameters=[
+            OpenApiParameter('stream', int, enum=[0, 1],
+                             description='Stream the whole list in chunks'),
+        ],
+    )
+    def list(self, request, *args, **kwargs):
+        """List the recipes from rows, without the serializer machinery
+
+        With ?stream=1 the list is read and sent chunk by chunk, so memory
+        does not grow with the number of recipes.
+        """
+        if request.query_params.get('stream') in ('1', 'true'):
+            return JSONArrayResponse(representations.iter_represent(
+                self.filter_queryset(self.get_queryset()), request,
+                chunk_size=self.stream_chunk_size))
+        queryset = self.filter_queryset(self.get_queryset()) \
+            .values_list(*representations.fields())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                representations.represent_rows(page, request))
+        rows = list(queryset)
+        return Response(representations.represent_rows(rows, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return one recipe from its row, like list"""
+        queryset = self.filter_queryset(self.get_queryset()) \
+            .values_list(*representations.fields(detail=True), 'version')
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        *row, version = get_object_or_404(
+            queryset, **{self.lookup_field: kwargs[lookup_url_kwarg]})
+        response = Response(representations.represent_rows(
+            [row], request, detail=True)[0])
+        response['ETag'] = conditional.etag(version)
+        return response
+
+    def create(self, request, *args, **kwargs):
+        """Create a recipe, its ETag is the first version"""
+        response = super().create(request, *args, **kwargs)
+        response['ETag'] = conditional.etag(self.written_version)
+        return response
+
     def perform_create(self, serializer):
         """Method to create a recipe with the auth user"""
         serializer.save(user=self.request.user)
+        # adding the tags and ingredients moved the version on
+        serializer.instance.refresh_from_db(fields=['version'])
+        self.written_version = serializer.instance.version
+
+    def update(self, request, *args, **kwargs):
+        """Update a recipe, only at the version of If-Match when sent
+
+        Send the ETag of the last read or write in If-Match: a recipe
+        changed in between is left alone and 412 is returned.
+        """
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = conditional.etag(self.written_version)
+        return response
+
+    def perform_update(self, serializer):
+        """Write with one UPDATE conditional on the version"""
+        versions = conditional.if_match_versions(self.request)
+        with transaction.atomic():
+            serializer.save(versions=versions)
+        self.written_version = serializer.instance.version
+
+    @extend_schema(parameters=[
+        OpenApiParameter('ids', str, required=True,
+                         description='Comma separated recipe IDs'),
+    ])
+    @action(methods=['GET'], detail=False)
+    def batch(self, request):
+        """Retrieve several recipes in the order of the requested IDs"""
+        try:
+            ids = [int(i) for i in request.query_params.get('ids', '')
+                   .split(',') if i.strip()]
+        except ValueError:
+            return Response({'ids': ['IDs must be integers.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ids = list(dict.fromkeys(ids))
+        if not ids or len(ids) > self.batch_max_ids:
+            return Response(
+                {'ids': [f'Between 1 and {self.batch_max_ids} IDs.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        found = self._get_in_order(ids)
+        serializer = self.get_serializer(
+            [found[i] for i in ids if i in found], many=True)
+        return Response({
+            'results': serializer.data,
+            'not_found': [i for i in ids if i not in found],
+        })
+
+    def _get_in_order(self, ids):
+        """Return {id: recipe} with tags and ingredients prefetched"""
+        return self.get_queryset().prefetch_related('tags', 'ingredients') \
+            .in_bulk(ids)
+
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False)
+    def bulk(self, request):
+        """Create, partially update or delete many recipes at once
+
+        Items failing validation are reported by index and the others are
+        written, unless ?atomic=1 asks for all or nothing.
+        """
+        items = request.data
+        if not isinstance(items, list) or \
+                not 0 < len(items) <= self.bulk_max_items:
+            return Response(
+                {'non_field_errors': [
+                    f'Expected a list of 1 to {self.bulk_max_items} items.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        atomic = request.query_params.get('atomic') in ('1', 'true')
+        if request.method == 'POST':
+            return self._bulk_create(items, atomic)
+        elif request.method == 'PATCH':
+            return self._bulk_update(items, atomic)
+        return self._bulk_delete(items, atomic)
+
+    def _bulk_response(self, recipes, errors, success_status):
+        """Serialize the written recipes along with the item errors"""
+        found = self._get_in_order([recipe.id for recipe in recipes])
+        serializer = self.get_serializer(
+            [found[recipe.id] for recipe in recipes], many=True)
+        return Response({'results': serializer.data, 'errors': errors},
+                        status=success_status)
+
+    def _bulk_create(self, items, atomic):
+        valid, errors = [], []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        if errors and (atomic or not valid):
+            return Response({'errors': errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            recipes = bulk.bulk_create_recipes(self.request.user, valid)
+        return self._bulk_response(recipes, errors, status.HTTP_201_CREATED)
+
+    def _bulk_update(self, items, atomic):
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        recipes = self.get_queryset().in_bulk(
+            [i for i in ids if _is_id(i)])
+        updates, errors = [], []
+        for index, item in enumerate(items):
+            recipe_id = item.get('id') if isinstance(item, dict) else None
+            recipe = recipes.get(recipe_id) if _is_id(recipe_id) else None
+            if recipe is None:
+                errors.append({'index': index,
+                               'errors': {'id': ['Not found.']}})
+                continue
+            serializer = self.get_serializer(recipe, data=item, partial=True)
+            if serializer.is_valid():
+                updates.append((recipe, serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        if errors and (atomic or not updates):
+            return Response({'errors': errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            recipes = bulk.bulk_update_recipes(self.request.user, updates)
+        return self._bulk_response(recipes, errors, status.HTTP_200_OK)
+
+    def _bulk_delete(self, items, atomic):
+        if not all(_is_id(i) for i in items):
+            return Response({'non_field_errors': ['Expected recipe IDs.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            deleted = bulk.bulk_delete_recipes(self.request.user, items)
+            not_found = sorted(set(items) - set(deleted))
+            if not_found and atomic:
+                transaction.set_rollback(True)
+                return Response({'not_found': not_found},
+                                status=status.HTTP_400_BAD_REQUEST)
+        return Response({'deleted': deleted, 'not_found': not_found})
+
+    @extend_schema(responses=serializers.RecipeDetailsSerializer(many=True))
+    @action(methods=['POST'], detail=True)
+    def clone(self, request, pk=None):
+        """Copy the recipe, optionally several times, in the database"""
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = dict(serializer.validated_data)
+        with transaction.atomic():
+            copies = bulk.clone_recipe(recipe, **options)
+        found = self._get_in_order([copy.id for copy in copies])
+        serializer = serializers.RecipeDetailsSerializer(
+            [found[copy.id] for copy in copies], many=True,
+            context=self.get_serializer_context())
+        return Response({'results': serializer.data},
+                        status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        parameters=[serializers.SimilarQuerySerializer],
+        responses=serializers.SimilarRecipeSerializer(many=True),
+    )
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Rank the recipes sharing the most ingredients and tags"""
+        recipe = self.get_object()
+        query = serializers.SimilarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        ranked = similar_recipes(request.user.id, recipe.id,
+                                 **query.validated_data)
+        found = self._get_in_order([recipe_id for _, recipe_id in ranked])
+        serializer = serializers.SimilarRecipeSerializer(
+            [{'score': score, 'recipe': found[recipe_id]}
+             for score, recipe_id in ranked if recipe_id in found],
+            many=True, context=self.get_serializer_context())
+        return Response({'results': serializer.data})
+
+    @extend_schema(responses=serializers.PantryMatchSerializer(many=True))
+    @action(methods=['POST'], detail=False)
+    def pantry(self, request):
+        """Rank the recipes that can be cooked with the given ingredients
+
+        Recipes missing nothing come first, then the ones missing one or
+        two ingredients.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        matches = pantry_matches(request.user.id, data['ingredients'],
+                                 data['max_missing'], data['limit'])
+        found = self._get_in_order([recipe_id for recipe_id, _, _ in matches])
+        serializer = serializers.PantryMatchSerializer(
+            [{'recipe': found[recipe_id], 'missing': missing,
+              'coverage': coverage}
+             for recipe_id, missing, coverage in matches
+             if recipe_id in found],
+            many=True, context=self.get_serializer_context())
+        return Response({'results': serializer.data})
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('stream', int, enum=[0, 1],
+                             description='Stream newline delimited JSON'),
+        ],
+        responses=serializers.ShoppingListItemSerializer(many=True),
+    )
+    @action(methods=['POST'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """Merge the ingredients of the recipes selected by IDs or a filter
+
+        Each ingredient is listed once with the number of selected recipes
+        using it, counted by one grouped query over the through table.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = bulk.select_recipes(
+            request.user,
+            recipe_ids=serializer.validated_data.get('recipes'),
+            filters=serializer.validated_data.get('filter'),
+        )
+        items = Ingredient.objects.filter(recipe__in=recipes.values('id')) \
+            .values('id', 'name') \
+            .annotate(recipe_count=Count('recipe')) \
+            .order_by('name', 'id')
+        if request.query_params.get('stream') in ('1', 'true'):
+            return JSONLinesResponse(items.iterator(chunk_size=2000))
+        return Response({'results': list(items)})
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
@@ -37,30 +341,150 @@ class RecipeViewSet(viewsets.ModelViewSet):
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
         if serializer.is_valid():
+            metrics.observe('recipe_image_upload_bytes',
+                            serializer.validated_data['image'].size)
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+@extend_schema_view(list=extend_schema(parameters=[
+    OpenApiParameter('assigned_only', int, enum=[0, 1],
+                     description='Only items assigned to recipes'),
+    OpenApiParameter('recipe_count', int, enum=[0, 1],
+                     description='Include the number of recipes using it'),
+]))
+class BaseRecipeAttrViewSet(CoalesceReadsMixin,
+                            ServerTimingMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
     """Base view sset for recipe attr"""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    recipe_field = None
+    usage_serializer_class = None
+
+    def _flag(self, name):
+        return self.request.query_params.get(name) in ('1', 'true')
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action != 'list':
+            return queryset.order_by('-name')
+        through = getattr(Recipe, self.recipe_field).through
+        column = f'{self.queryset.model._meta.model_name}_id'
+        if self._flag('assigned_only'):
+            queryset = queryset.filter(Exists(
+                through.objects.filter(**{column: OuterRef('pk')})))
+        if self._flag('recipe_count'):
+            queryset = queryset.annotate(recipe_count=Count('recipe'))
+        return queryset.order_by('-name')
+
+    def get_serializer_class(self):
+        """Choose the serializer depending on the action"""
+        if self.action in ('assign', 'unassign'):
+            return serializers.RecipeSelectionSerializer
+        elif self.action == 'list' and self._flag('recipe_count'):
+            return self.usage_serializer_class
+        return self.serializer_class
+
+    def _selected_recipes(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return bulk.select_recipes(
+            request.user,
+            recipe_ids=serializer.validated_data.get('recipes'),
+            filters=serializer.validated_data.get('filter'),
+        )
+
+    @action(methods=['POST'], detail=True)
+    def assign(self, request, pk=None):
+        """Attach to the recipes selected by IDs or by a filter"""
+        obj = self.get_object()
+        with transaction.atomic():
+            recipe_ids = bulk.attach(self.recipe_field, obj,
+                                     self._selected_recipes(request))
+        return Response({'assigned': len(recipe_ids)})
+
+    @action(methods=['POST'], detail=True)
+    def unassign(self, request, pk=None):
+        """Detach from the recipes selected by IDs or by a filter"""
+        obj = self.get_object()
+        with transaction.atomic():
+            recipe_ids = bulk.detach(self.recipe_field, obj,
+                                     self._selected_recipes(request))
+        return Response({'unassigned': len(recipe_ids)})
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Viewset for tags that handles endpoints"""
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'
+    usage_serializer_class = serializers.TagUsageSerializer
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Viewsets for ingrediant features"""
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+    recipe_field = 'ingredients'
+    usage_serializer_class = serializers.IngredientUsageSerializer
+
+
+class ChangesView(ServerTimingMixin, APIView):
+    """Feed of the recipes, tags and ingredients changed since a cursor"""
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    kinds = {
+        'recipe': (Recipe.objects.prefetch_related('tags', 'ingredients'),
+                   serializers.RecipeDetailsSerializer),
+        'tag': (Tag.objects.all(), serializers.TagSerializer),
+        'ingredient': (Ingredient.objects.all(),
+                       serializers.IngredientSerializer),
+    }
+
+    @extend_schema(parameters=[serializers.ChangesQuerySerializer],
+                   responses=serializers.ChangesSerializer)
+    def get(self, request):
+        """Return the next changes, start without a cursor for a full sync
+
+        Keep the returned cursor and ask again until has_more is false.
+        """
+        query = serializers.ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        position = query.validated_data.get('cursor')
+        limit = query.validated_data['limit']
+        rows = sync.changes(request.user, position, limit)
+        page = rows[:limit]
+        live = {kind: [] for kind in self.kinds}
+        for _, rank, _, kind, object_id in page:
+            if rank != sync.RANKS['tombstone']:
+                live[kind].append(object_id)
+        found = {}
+        for kind, (queryset, _) in self.kinds.items():
+            found[kind] = queryset.filter(user=request.user) \
+                .in_bulk(live[kind]) if live[kind] else {}
+        results = []
+        for _, rank, _, kind, object_id in page:
+            if rank == sync.RANKS['tombstone']:
+                results.append({'type': kind, 'id': object_id,
+                                'deleted': True, 'data': None})
+            elif object_id in found[kind]:
+                serializer_class = self.kinds[kind][1]
+                data = serializer_class(
+                    found[kind][object_id],
+                    context={'request': request}).data
+                results.append({'type': kind, 'id': object_id,
+                                'deleted': False, 'data': data})
+        if page:
+            cursor = sync.encode_cursor(page[-1][:3])
+        else:
+            cursor = request.query_params.get('cursor')
+        return Response({
+            'results': results,
+            'cursor': cursor,
+            'has_more': len(rows) > limit,
+        })
@@ -6,6 +6,7 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from core.models import Job
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
@@ -77,6 +78,24 @@ class PuplicUserAPITest(TestCase):
         self.assertIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_login_rotates_token(self):
+        """Test logging in again replaces the previous token"""
+        create_user(email='test@example.com', password='test1234')
+        payload = {'email': 'test@example.com', 'password': 'test1234'}
+
+        first = self.client.post(TOKEN_URL, payload).data['token']
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertIn('expires_at', res.data)
+        self.assertNotEqual(res.data['token'], first)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {first}')
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {res.data["token"]}')
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
     def test_create_token_for_user_wrong_info(self):
         """Test returning error loggin in if info is false"""
         user_details = {
@@ -166,3 +185,12 @@ class PrivateUserAPITest(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_me(self):
+        """Test deleting the account deactivates it at once"""
+        res = self.client.delete(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        job = Job.objects.get(user=self.user)
+        self.assertEqual(job.payload, {'user_id': self.user.id})
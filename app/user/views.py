@@ -2,32 +2,57 @@
 Views for the user API (endpoints)
 """
 
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from core import deletion, tokens
+from core.authentication import ExpiringTokenAuthentication
+from core.profiling import ServerTimingMixin
+from core.throttling import (
+    AnonBucketThrottle,
+    ConcurrencyThrottle,
+    LoginBucketThrottle,
+)
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer
 )
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(ServerTimingMixin, generics.CreateAPIView):
     """Create a new user in the system"""
     serializer_class = UserSerializer
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(ServerTimingMixin, ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = [AnonBucketThrottle, LoginBucketThrottle,
+                        ConcurrencyThrottle]
+
+    def post(self, request, *args, **kwargs):
+        """Log in, replacing the previous token of the user with a new one"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token = tokens.rotate(serializer.validated_data['user'])
+        return Response({'token': token.key,
+                         'expires_at': tokens.expires_at(token)})
 
 
-class UpdateUserView(generics.RetrieveUpdateAPIView):
-    """Update a user"""
+class UpdateUserView(ServerTimingMixin,
+                     generics.RetrieveUpdateDestroyAPIView):
+    """Update or delete a user"""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication, ]
+    authentication_classes = [ExpiringTokenAuthentication, ]
     permission_classes = [permissions.IsAuthenticated, ]
 
     def get_object(self):
         """retrieve and return the auth user"""
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """Deactivate the account now and delete its data in background"""
+        deletion.request_deletion(self.get_object())
+        return Response(status=status.HTTP_202_ACCEPTED)